@@ -14,6 +14,10 @@ Task 对象提供了更丰富的功能，如取消、状态查询、异常处理
 """
 
 import asyncio
+import collections.abc
+import contextvars
+import itertools
+import sys
 import time
 from datetime import datetime
 
@@ -83,6 +87,66 @@ async def task_status_demo():
 
 
 # 3. Task 的取消功能
+def _task_name(task):
+    """任务名；没有自定义名字时使用协程名"""
+    name = task.get_name() if hasattr(task, 'get_name') else ''  # Python 3.8+
+    # 安装了 Task 工厂时，Python 3.13.0 会把任务名设为字符串 'None'
+    if name and not name.startswith('Task-') and name != 'None':
+        return name
+    coro = task.get_coro() if hasattr(task, 'get_coro') else None
+    return getattr(coro, '__qualname__', None) or repr(task)
+
+
+async def cancel_all(tasks, grace_period=1.0, escalation_period=None):
+    """批量取消任务，并限定清理代码（except asyncio.CancelledError 块）的时间
+    
+    1. 一次性 cancel() 所有未完成的任务，再用一个 asyncio.wait 等待它们结束，
+       而不是逐个 cancel + await
+    2. grace_period 秒后仍未结束的任务记为清理超时（overran），升级处理：
+       再 cancel() 一次，打断它们正在 await 的清理代码
+    3. 再等待 escalation_period 秒（默认与 grace_period 相同），
+       仍未结束的任务记为放弃（abandoned），由调用方决定如何处理
+    
+    返回报告字典：cancelled（已取消）、finished（取消前已正常结束）、
+    failed（[(任务名, 异常)]）、overran、abandoned（任务名列表）和 elapsed（秒）。
+    """
+    start_time = time.perf_counter()
+    pending = [task for task in tasks if not task.done()]
+    for task in pending:
+        task.cancel()
+    
+    overran = abandoned = set()
+    if pending:
+        _, overran = await asyncio.wait(pending, timeout=grace_period)
+        if overran:
+            for task in overran:
+                task.cancel()
+            _, abandoned = await asyncio.wait(
+                overran,
+                timeout=grace_period if escalation_period is None else escalation_period
+            )
+    
+    report = {
+        'cancelled': 0,
+        'finished': 0,
+        'failed': [],
+        'overran': [_task_name(task) for task in overran],
+        'abandoned': [_task_name(task) for task in abandoned],
+        'elapsed': time.perf_counter() - start_time,
+    }
+    for task in tasks:
+        if not task.done():
+            continue
+        if task.cancelled():
+            report['cancelled'] += 1
+        elif task.exception() is not None:
+            # 清理代码本身出错；读取异常，避免"exception was never retrieved"警告
+            report['failed'].append((_task_name(task), task.exception()))
+        else:
+            report['finished'] += 1
+    return report
+
+
 async def task_cancellation_demo():
     """演示如何取消 Task"""
     print("=== Task 取消演示 ===")
@@ -115,6 +179,63 @@ async def task_cancellation_demo():
     
     print(f"任务是否取消: {task.cancelled()}")
     print()
+    
+    # 批量取消：成千上万个任务时，逐个 cancel + await 太慢
+    print("批量取消演示:")
+    
+    async def worker(cleanup):
+        """被取消时需要 cleanup 秒清理的任务"""
+        try:
+            await asyncio.sleep(3600)
+        except asyncio.CancelledError:
+            await asyncio.sleep(cleanup)
+            raise
+    
+    tasks = [asyncio.create_task(worker(0.001)) for _ in range(200)]
+    await asyncio.sleep(0)
+    start_time = time.perf_counter()
+    for task in tasks:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    print(f"逐个取消 200 个任务耗时: {time.perf_counter() - start_time:.2f} 秒")
+    
+    tasks = [asyncio.create_task(worker(0.001)) for _ in range(20000)]
+    await asyncio.sleep(0)
+    report = await cancel_all(tasks, grace_period=1.0)
+    print(f"批量取消 {report['cancelled']} 个任务耗时: {report['elapsed']:.2f} 秒")
+    
+    # 清理超时与升级
+    async def slow_cleanup():
+        """清理很慢，升级时再次被取消后立即退出"""
+        try:
+            await asyncio.sleep(3600)
+        except asyncio.CancelledError:
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                print("慢清理任务: 清理被打断")
+            raise
+    
+    async def ignores_cancel():
+        """错误示范：吞掉取消，继续工作 1.5 秒后才退出"""
+        deadline = time.perf_counter() + 1.5
+        while time.perf_counter() < deadline:
+            try:
+                await asyncio.sleep(0.1)
+            except asyncio.CancelledError:
+                pass
+    
+    tasks = [asyncio.create_task(worker(0.01)) for _ in range(100)]
+    tasks.append(asyncio.create_task(slow_cleanup()))
+    tasks.append(asyncio.create_task(ignores_cancel()))
+    await asyncio.sleep(0)
+    report = await cancel_all(tasks, grace_period=0.3)
+    print(f"已取消 {report['cancelled']} 个, 清理超时 {len(report['overran'])} 个, "
+          f"升级后仍未结束 {report['abandoned']}, 耗时 {report['elapsed']:.2f} 秒")
+    print()
 
 
 # 4. 并发执行多个 Task
@@ -148,6 +269,117 @@ async def concurrent_tasks_demo():
 
 
 # 5. Task 的异常处理
+class TaskGroupError(Exception):
+    """任务组中有任务失败
+    
+    errors: [(任务名, 异常), ...]，包含所有失败的任务，而不只是第一个
+    overran: 取消后没能在 cleanup_timeout 内结束的任务名
+    """
+    
+    def __init__(self, errors, overran=()):
+        self.errors = list(errors)
+        self.overran = list(overran)
+        lines = [f"{len(self.errors)} 个任务失败:"]
+        lines += [f"  {name}: {type(error).__name__}: {error}"
+                  for name, error in self.errors]
+        if self.overran:
+            lines.append(f"  清理超时: {', '.join(self.overran)}")
+        super().__init__('\n'.join(lines))
+
+
+class FailFastGroup:
+    """快速失败的结构化任务组（不依赖 Python 3.11 的 asyncio.TaskGroup）
+    
+        async with FailFastGroup(cleanup_timeout=1.0) as group:
+            group.create_task(fetch_a())
+            group.create_task(fetch_b())
+    
+    - 退出 async with 时等待组内所有任务完成
+    - 任意一个任务失败，立即取消其余任务和 async with 主体（与 asyncio.TaskGroup 相同），
+      不再等它们白白跑完
+    - 被取消的任务最多有 cleanup_timeout 秒执行清理代码，超时的记入 overran，
+      不会无限期地拖住调用方
+    - 所有失败汇总成一个 TaskGroupError 抛出
+    """
+    
+    def __init__(self, cleanup_timeout=1.0):
+        self.cleanup_timeout = cleanup_timeout
+        self.overran = []
+        self._tasks = {}  # Task -> 任务名
+        self._parent = None
+        self._exiting = False
+        self._aborting = False
+        self._parent_cancel_requested = False
+    
+    def create_task(self, coro, name=None):
+        """在组内创建任务；name 用于错误报告，默认使用协程名"""
+        task = asyncio.create_task(coro)
+        self._tasks[task] = name or coro.__qualname__
+        task.add_done_callback(self._on_task_done)
+        return task
+    
+    async def __aenter__(self):
+        self._parent = asyncio.current_task()
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        self._exiting = True
+        if exc_type is asyncio.CancelledError and self._parent_cancel_requested:
+            # 主体是因为组内任务失败才被取消的，改为抛出 TaskGroupError；
+            # 同时还有外部取消时（Python 3.11+ 能区分）继续向上传递 CancelledError
+            uncancel = getattr(self._parent, 'uncancel', None)
+            if uncancel is None or uncancel() == 0:
+                exc_type = None
+        try:
+            while exc_type is None:
+                # 每轮重新收集，任务运行中新建的兄弟任务也会被等待
+                pending = {task for task in self._tasks if not task.done()}
+                if not pending or self._failed():
+                    break
+                await asyncio.wait(pending, return_when=asyncio.FIRST_EXCEPTION)
+        finally:
+            # 有任务失败、async with 内部出错或调用方被取消时，取消剩余任务
+            await self._cancel_pending()
+        
+        errors = self._failed()
+        if errors and exc_type is None:
+            raise TaskGroupError(errors, self.overran)
+        return False
+    
+    def _on_task_done(self, task):
+        """第一个任务失败时立即取消兄弟任务，主体还在运行时也取消主体"""
+        if task.cancelled() or task.exception() is None or self._aborting:
+            return
+        self._abort()
+        if not self._exiting and self._parent is not None and not self._parent.done():
+            self._parent_cancel_requested = True
+            self._parent.cancel()
+    
+    def _failed(self):
+        return [
+            (name, task.exception())
+            for task, name in self._tasks.items()
+            if task.done() and not task.cancelled() and task.exception() is not None
+        ]
+    
+    def _abort(self):
+        """取消所有未完成的任务；只取消一次，重复取消会打断任务正在执行的清理代码"""
+        if self._aborting:
+            return
+        self._aborting = True
+        for task in self._tasks:
+            if not task.done():
+                task.cancel()
+    
+    async def _cancel_pending(self):
+        pending = [task for task in self._tasks if not task.done()]
+        if not pending:
+            return
+        self._abort()
+        _, still_running = await asyncio.wait(pending, timeout=self.cleanup_timeout)
+        self.overran = [self._tasks[task] for task in still_running]
+
+
 async def task_exception_demo():
     """演示 Task 的异常处理"""
     print("=== Task 异常处理演示 ===")
@@ -186,6 +418,32 @@ async def task_exception_demo():
     print(f"失败任务是否完成: {task2.done()}")
     print(f"失败任务异常: {task2.exception()}")
     print()
+    
+    # 快速失败的任务组：第一个失败发生后，其余任务不再继续占用资源
+    print("使用 FailFastGroup:")
+    
+    async def slow_task(name, duration, cleanup):
+        """耗时较长的任务，被取消时需要 cleanup 秒清理"""
+        try:
+            await asyncio.sleep(duration)
+            return f"{name} 成功"
+        except asyncio.CancelledError:
+            print(f"{name} 被取消，开始清理")
+            await asyncio.sleep(cleanup)
+            raise
+    
+    start_time = time.time()
+    try:
+        async with FailFastGroup(cleanup_timeout=1.0) as group:
+            group.create_task(successful_task("成功任务"), name="成功任务")
+            group.create_task(failing_task("失败任务A"), name="失败任务A")
+            group.create_task(failing_task("失败任务B"), name="失败任务B")
+            group.create_task(slow_task("慢任务", 5, 0.2), name="慢任务")
+            group.create_task(slow_task("清理很慢的任务", 5, 3), name="清理很慢的任务")
+    except TaskGroupError as e:
+        print(e)
+    print(f"任务组耗时: {time.time() - start_time:.2f} 秒（逐个等待需要 5 秒）")
+    print()
 
 
 # 6. Task 的超时处理
@@ -221,6 +479,97 @@ async def task_timeout_demo():
 
 
 # 7. Task 的优先级和调度
+class PriorityScheduler:
+    """基于堆的优先级任务调度器
+    
+    asyncio 本身没有优先级的概念：所有就绪的 Task 按先来后到轮流执行。
+    这里用固定数量的工作协程从 asyncio.PriorityQueue（内部是堆）中取任务，
+    数值越小优先级越高。
+    
+    为了避免低优先级任务被饿死，排序键加入了"老化"：
+    任务每等待 aging_interval 秒，相当于优先级提升一级。
+    有效优先级 = priority - 已等待时间 / aging_interval，
+    比较两个任务时当前时间可以消掉，所以排序键
+    priority + 入队时间 / aging_interval 在入队时就能确定，堆无需重新排序。
+    """
+    
+    def __init__(self, workers=2, aging_interval=1.0):
+        self.workers = workers
+        self.aging_interval = aging_interval
+        self._queue = asyncio.PriorityQueue()
+        self._worker_tasks = []
+        self._sequence = 0  # 排序键相同时按提交顺序执行
+        self._waits = {}  # 优先级 -> 等待时间列表
+    
+    def start(self):
+        self._worker_tasks = [
+            asyncio.create_task(self._worker()) for _ in range(self.workers)
+        ]
+        return self
+    
+    def submit(self, priority, func, *args):
+        """提交任务 func(*args)，返回可以 await 结果的 Future"""
+        loop = asyncio.get_running_loop()
+        enqueued_at = loop.time()
+        future = loop.create_future()
+        key = priority + enqueued_at / self.aging_interval
+        self._sequence += 1
+        self._queue.put_nowait(
+            (key, self._sequence, priority, enqueued_at, func, args, future)
+        )
+        return future
+    
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            _, _, priority, enqueued_at, func, args, future = await self._queue.get()
+            try:
+                if future.cancelled():
+                    continue
+                self._waits.setdefault(priority, []).append(loop.time() - enqueued_at)
+                try:
+                    result = await func(*args)
+                except asyncio.CancelledError:
+                    # 工作协程自己被取消（close 时）才退出；任务内部的取消只影响它自己的 Future
+                    current = asyncio.current_task()
+                    if getattr(current, 'cancelling', lambda: 0)():
+                        raise
+                    future.cancel()
+                except BaseException as e:
+                    # 任何异常都交给 Future，不能让一个任务带走工作协程
+                    if not future.cancelled():
+                        future.set_exception(e)
+                else:
+                    if not future.cancelled():
+                        future.set_result(result)
+            finally:
+                self._queue.task_done()
+    
+    def wait_stats(self):
+        """每个优先级的等待时间统计（秒）：次数、平均值、最大值"""
+        return {
+            priority: {
+                'count': len(waits),
+                'avg': sum(waits) / len(waits),
+                'max': max(waits),
+            }
+            for priority, waits in sorted(self._waits.items())
+        }
+    
+    async def close(self):
+        """等待队列中的任务全部执行完，然后停止工作协程"""
+        await self._queue.join()
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+    
+    async def __aenter__(self):
+        return self.start()
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+
 async def task_priority_demo():
     """演示 Task 的优先级和调度"""
     print("=== Task 优先级演示 ===")
@@ -232,7 +581,7 @@ async def task_priority_demo():
         print(f"[{datetime.now().strftime('%H:%M:%S')}] {name} 完成")
         return f"{name} 结果"
     
-    # 创建不同优先级的任务
+    # 直接创建的 Task 没有优先级：三个任务同时开始，优先级只是一个标签
     tasks = [
         asyncio.create_task(priority_task("高优先级", "高", 1)),
         asyncio.create_task(priority_task("中优先级", "中", 1)),
@@ -243,6 +592,385 @@ async def task_priority_demo():
     results = await asyncio.gather(*tasks)
     print(f"所有任务结果: {results}")
     print()
+    
+    # 使用优先级调度器：2 个工作协程，数值越小优先级越高
+    print("使用 PriorityScheduler（2 个工作协程）:")
+    labels = {0: "高", 1: "中", 2: "低"}
+    async with PriorityScheduler(workers=2, aging_interval=1.0) as scheduler:
+        # 先提交一批低优先级的批量任务
+        futures = [
+            scheduler.submit(2, priority_task, f"批量任务{i}", labels[2], 0.2)
+            for i in range(6)
+        ]
+        await asyncio.sleep(0.1)
+        # 稍后到达的高、中优先级任务会插到剩余批量任务的前面
+        futures += [
+            scheduler.submit(0, priority_task, f"紧急任务{i}", labels[0], 0.2)
+            for i in range(2)
+        ]
+        futures.append(scheduler.submit(1, priority_task, "普通任务", labels[1], 0.2))
+        await asyncio.gather(*futures)
+    
+    print("各优先级等待时间:")
+    for priority, stats in scheduler.wait_stats().items():
+        print(f"  {labels[priority]}优先级: {stats['count']} 个任务, "
+              f"平均等待 {stats['avg']:.2f} 秒, 最长等待 {stats['max']:.2f} 秒")
+    print()
+
+
+# 8. Task 生命周期统计（自定义 Task 工厂）
+class Log2Histogram:
+    """按 2 的幂分桶的直方图，内存占用固定
+    
+    时间以微秒为单位记录，第 b 个桶覆盖 [2^(b-1), 2^b) 微秒；
+    步数这类整数直接按原值分桶。
+    """
+    
+    def __init__(self, scale=1_000_000):
+        self.scale = scale
+        self.buckets = [0] * 64
+        self.count = 0
+        self.max = 0
+    
+    def record(self, value):
+        self.buckets[min(63, int(value * self.scale).bit_length())] += 1
+        self.count += 1
+        self.max = max(self.max, value)
+    
+    def percentile(self, fraction):
+        """返回分位数所在桶的上界（不超过最大值）"""
+        target = fraction * self.count
+        seen = 0
+        for bucket, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= target:
+                return min((1 << bucket) / self.scale, self.max)
+        return self.max
+
+
+class _InstrumentedCoroutine(collections.abc.Coroutine):
+    """包装协程，统计被事件循环推进的次数（步数）和首次执行、结束的时间
+    
+    每一步只多一次 Python 方法调用；时间只在第一步和结束时各取一次。
+    """
+    
+    __slots__ = ('coro', 'metrics', 'task', 'created', 'first_run', 'steps')
+    
+    def __init__(self, coro, metrics):
+        self.coro = coro
+        self.metrics = metrics
+        self.task = None
+        self.created = time.perf_counter()
+        self.first_run = None
+        self.steps = 0
+    
+    def send(self, value):
+        if self.first_run is None:
+            self.first_run = time.perf_counter()
+        self.steps += 1
+        try:
+            return self.coro.send(value)
+        except BaseException:
+            # StopIteration（正常返回）、异常或取消，协程都已结束
+            self.metrics._finish(self)
+            raise
+    
+    def throw(self, *args):
+        # 开始执行前就被取消的任务，第一步就是 throw(CancelledError)
+        if self.first_run is None:
+            self.first_run = time.perf_counter()
+        self.steps += 1
+        try:
+            return self.coro.throw(*args)
+        except BaseException:
+            self.metrics._finish(self)
+            raise
+    
+    def close(self):
+        return self.coro.close()
+    
+    def __await__(self):
+        return self
+    
+    def __next__(self):
+        return self.send(None)
+    
+    def __getattr__(self, name):
+        # cr_code、cr_frame 等属性转给原协程，Task 的 repr 与原来一致
+        return getattr(self.coro, name)
+
+
+class TaskMetrics:
+    """通过 loop.set_task_factory 收集每个 Task 的生命周期
+    
+    记录每个任务的创建、首次执行和结束时间以及步数，按任务名
+    （没有自定义名字时用协程的 __qualname__）汇总成直方图：
+    - delay: 调度延迟，从创建到第一次执行，反映就绪队列的积压
+    - duration: 从创建到结束的总时间
+    - steps: 执行过程中被事件循环推进的次数
+    
+    sample_every=N 时只统计每 N 个任务中的一个，其余任务不做任何包装，
+    长期开启时可以把开销降到接近零。
+    
+        metrics = TaskMetrics(sample_every=10).install()
+        ...
+        metrics.uninstall()
+        metrics.print_report()
+    """
+    
+    def __init__(self, sample_every=1):
+        self.sample_every = sample_every
+        self.stats = {}  # 名字 -> {'delay', 'duration', 'steps'} 直方图
+        self._created = 0
+        self._loop = None
+        self._previous_factory = None
+    
+    def install(self, loop=None):
+        self._loop = loop or asyncio.get_running_loop()
+        self._previous_factory = self._loop.get_task_factory()
+        self._loop.set_task_factory(self._factory)
+        return self
+    
+    def uninstall(self):
+        self._loop.set_task_factory(self._previous_factory)
+    
+    def _factory(self, loop, coro, **kwargs):
+        # Python 3.11+ 会额外传入 context 等关键字参数，原样转交
+        self._created += 1
+        if self._created % self.sample_every:
+            wrapper = None
+        else:
+            coro = wrapper = _InstrumentedCoroutine(coro, self)
+        if self._previous_factory is not None:
+            task = self._previous_factory(loop, coro, **kwargs)
+        else:
+            task = asyncio.Task(coro, loop=loop, **kwargs)
+        if wrapper is not None:
+            wrapper.task = task
+        return task
+    
+    def _finish(self, wrapper):
+        finished = time.perf_counter()
+        task, wrapper.task = wrapper.task, None
+        # 任务名在工厂返回之后才设置，所以在结束时再取
+        name = _task_name(task) if task is not None else wrapper.coro.__qualname__
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = {
+                'delay': Log2Histogram(),
+                'duration': Log2Histogram(),
+                'steps': Log2Histogram(scale=1),
+            }
+        stats['delay'].record(wrapper.first_run - wrapper.created)
+        stats['duration'].record(finished - wrapper.created)
+        stats['steps'].record(wrapper.steps)
+    
+    def print_report(self, top=10):
+        """按调度延迟 p99 从高到低打印"""
+        rows = sorted(self.stats.items(),
+                      key=lambda item: item[1]['delay'].percentile(0.99),
+                      reverse=True)
+        for name, stats in rows[:top]:
+            delay, duration, steps = stats['delay'], stats['duration'], stats['steps']
+            print(f"  {name}: {delay.count} 个, "
+                  f"调度延迟 p50 {delay.percentile(0.5) * 1000:.2f} ms / "
+                  f"p99 {delay.percentile(0.99) * 1000:.2f} ms, "
+                  f"总时间 p99 {duration.percentile(0.99) * 1000:.2f} ms, "
+                  f"步数 p99 {steps.percentile(0.99):.0f}")
+
+
+async def task_metrics_demo():
+    """演示用自定义 Task 工厂统计任务的生命周期"""
+    print("=== Task 生命周期统计演示 ===")
+    
+    async def quick_check(i):
+        """大量同时创建的小任务，会在就绪队列中排队"""
+        await asyncio.sleep(0)
+        return i
+    
+    async def background_job(name, steps):
+        """需要多次让出控制权的后台任务"""
+        for _ in range(steps):
+            await asyncio.sleep(0.01)
+        return name
+    
+    async def n_tasks_per_second(n):
+        start_time = time.perf_counter()
+        await asyncio.gather(*[asyncio.create_task(quick_check(i)) for i in range(n)])
+        return n / (time.perf_counter() - start_time)
+    
+    await n_tasks_per_second(20000)  # 预热
+    baseline = await n_tasks_per_second(20000)
+    
+    # 抽样统计的开销
+    sampled = TaskMetrics(sample_every=10).install()
+    try:
+        sampled_rate = await n_tasks_per_second(20000)
+    finally:
+        sampled.uninstall()
+    
+    metrics = TaskMetrics().install()
+    try:
+        instrumented = await n_tasks_per_second(20000)
+        jobs = [asyncio.create_task(background_job(f"后台任务{i}", 5)) for i in range(3)]
+        named = asyncio.create_task(background_job("命名任务", 2))
+        if hasattr(named, 'set_name'):  # Python 3.8+
+            named.set_name("报表任务")
+        await asyncio.gather(*jobs, named)
+    finally:
+        metrics.uninstall()
+    
+    print(f"Task 吞吐量: 不统计 {baseline:.0f} 个/秒, 每 10 个统计 1 个 "
+          f"{sampled_rate:.0f} 个/秒, 全部统计 {instrumented:.0f} 个/秒")
+    print("各类任务的生命周期:")
+    metrics.print_report()
+    print()
+
+
+# 9. 立即执行的 Task（eager task）
+class _ResumedCoroutine(collections.abc.Coroutine):
+    """已经同步执行到第一次挂起的协程，交给 Task 从挂起处继续"""
+    
+    __slots__ = ('coro', 'first_yield', 'resumed')
+    
+    def __init__(self, coro, first_yield):
+        self.coro = coro
+        self.first_yield = first_yield
+        self.resumed = False
+    
+    def send(self, value):
+        if not self.resumed:
+            # Task 的第一步：把协程挂起时交出的 Future 原样交给 Task 去等待
+            self.resumed = True
+            return self.first_yield
+        return self.coro.send(value)
+    
+    def throw(self, *args):
+        self.resumed = True
+        return self.coro.throw(*args)
+    
+    def close(self):
+        return self.coro.close()
+    
+    def __await__(self):
+        return self
+    
+    def __next__(self):
+        return self.send(None)
+    
+    def __getattr__(self, name):
+        return getattr(self.coro, name)
+
+
+class _CompletedEagerTask(asyncio.Future):
+    """没有挂起就结束的协程的结果
+
+    创建时就已经完成，但和 Task 一样提供 get_name()/set_name()/get_coro()/get_context()，
+    create_task(coro, name=...) 和依赖这些方法的代码都能照常工作。
+    """
+    
+    __slots__ = ('_coro', '_context', '_name')
+    _counter = itertools.count(1)
+    
+    # 不定义 __init__：Python 层的 __init__ 会让创建开销翻倍，
+    # 由 _eager_task_factory 直接给三个槽赋值
+    
+    def get_name(self):
+        # 默认名字在第一次读取时才生成，大部分结果没有人读取名字
+        if self._name is None:
+            self._name = f"Task-eager-{next(self._counter)}"
+        return str(self._name)
+    
+    def set_name(self, value):
+        self._name = str(value)
+    
+    def get_coro(self):
+        return self._coro
+    
+    def get_context(self):
+        return self._context
+
+
+def _eager_task_factory(loop, coro, **kwargs):
+    """Python 3.12 之前的 eager_task_factory
+    
+    创建任务时立即同步执行协程，直到它第一次真正挂起：
+    - 没有挂起就结束（例如命中缓存）时，返回一个已经完成、
+      接口与 Task 相同的 Future，省去一次事件循环往返
+    - 挂起时才创建 Task，从挂起处继续执行
+    
+    与标准库的实现相比：同步执行的第一步中 asyncio.current_task() 返回的是调用方的任务，
+    因此第一步中不要使用依赖当前任务的 asyncio.timeout()；
+    Python 3.11 之前，第一步对 contextvars 的修改在之后的步骤中看不到。
+    """
+    context = kwargs.pop('context', None) or contextvars.copy_context()
+    try:
+        first_yield = context.run(coro.send, None)
+    except (Exception, asyncio.CancelledError) as e:
+        future = _CompletedEagerTask(loop=loop)
+        future._coro, future._context, future._name = coro, context, kwargs.get('name')
+        if isinstance(e, StopIteration):
+            future.set_result(e.value)
+        elif isinstance(e, asyncio.CancelledError):
+            future.cancel()
+        else:
+            future.set_exception(e)
+        return future
+    
+    if sys.version_info >= (3, 11):
+        kwargs['context'] = context
+    return asyncio.Task(_ResumedCoroutine(coro, first_yield), loop=loop, **kwargs)
+
+
+# Python 3.12+ 使用标准库的实现
+eager_task_factory = getattr(asyncio, 'eager_task_factory', _eager_task_factory)
+
+
+async def eager_task_demo():
+    """演示立即执行的 Task：大部分请求命中缓存时的吞吐量和延迟"""
+    print("=== 立即执行的 Task 演示 ===")
+    
+    cache = {}
+    
+    async def cached_lookup(key, started, latencies):
+        """命中缓存时不会挂起；未命中时模拟一次 1 毫秒的查询"""
+        if key not in cache:
+            await asyncio.sleep(0.001)
+            cache[key] = key * 2
+        latencies.append(time.perf_counter() - started)
+        return cache[key]
+    
+    async def run_lookups(n, hit_ratio):
+        """n 次查询，其中约 hit_ratio 的比例命中缓存"""
+        cache.clear()
+        hot_keys = 100
+        cache.update((key, key * 2) for key in range(hot_keys))
+        latencies = []
+        start_time = time.perf_counter()
+        tasks = []
+        for i in range(n):
+            key = i % hot_keys if (i % 100) < hit_ratio * 100 else hot_keys + i
+            tasks.append(asyncio.create_task(
+                cached_lookup(key, time.perf_counter(), latencies)
+            ))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start_time
+        latencies.sort()
+        return n / elapsed, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+    
+    loop = asyncio.get_running_loop()
+    implementation = "标准库" if eager_task_factory is not _eager_task_factory else "兼容实现"
+    previous_factory = loop.get_task_factory()
+    for name, factory in (("普通 Task", previous_factory),
+                          (f"立即执行({implementation})", eager_task_factory)):
+        loop.set_task_factory(factory)
+        try:
+            await run_lookups(2000, 0.95)  # 预热
+            rate, p50, p99 = await run_lookups(20000, 0.95)
+        finally:
+            loop.set_task_factory(previous_factory)
+        print(f"{name}: {rate:.0f} 个/秒, 延迟 p50 {p50 * 1000:.3f} ms / p99 {p99 * 1000:.3f} ms")
+    print()
 
 
 async def main():
@@ -270,6 +998,12 @@ async def main():
     # 7. 优先级和调度
     await task_priority_demo()
     
+    # 8. 生命周期统计
+    await task_metrics_demo()
+    
+    # 9. 立即执行的 Task
+    await eager_task_demo()
+    
     print("=== Task 总结 ===")
     print("1. Task 是对协程的包装")
     print("2. 可以使用 asyncio.create_task() 创建")
@@ -278,6 +1012,11 @@ async def main():
     print("5. Task 有执行状态和异常信息")
     print("6. Task 支持超时处理")
     print("7. Task 是 asyncio 并发编程的核心")
+    print("8. 需要优先级时，用堆排序的队列 + 固定数量的工作协程调度")
+    print("9. 一组任务中有一个失败时，应尽快取消其余任务")
+    print("10. 自定义 Task 工厂可以统计每类任务的调度延迟")
+    print("11. 大量任务应一次性取消，并限定清理时间")
+    print("12. 大多不会挂起的短任务可以立即执行，省去事件循环往返")
 
 
 if __name__ == "__main__":
@@ -8,18 +8,46 @@
 """
 
 import asyncio
+import aiofiles
 import aiohttp
+import array
+import bisect
+import collections
+import hashlib
+import heapq
+import io
+import json
+import os
+import random
 import requests
+import sys
+import tempfile
 import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, redirect_stdout
 from datetime import datetime
+from urllib.parse import urlsplit
 
 
 # 1. 同步网络请求（对比用）
-def sync_fetch_url(session, url):
-    """同步获取URL内容"""
+def sync_fetch_url(session, url, compact=False):
+    """同步获取URL内容
+
+    compact=True 时返回带单调时钟计时的 FetchResult，而不是字典。
+    """
+    started = time.perf_counter()
     try:
         response = session.get(url, timeout=10)
         response.raise_for_status()
+        if compact:
+            # response.elapsed 是从发出请求到解析完响应头的时间
+            return FetchResult(
+                url, response.status_code, len(response.content),
+                started=started,
+                first_byte=started + response.elapsed.total_seconds(),
+                finished=time.perf_counter(),
+            )
         return {
             'url': url,
             'status': response.status_code,
@@ -27,6 +55,9 @@ def sync_fetch_url(session, url):
             'time': time.time()
         }
     except Exception as e:
+        if compact:
+            return FetchResult(url, error=str(e), started=started,
+                               finished=time.perf_counter())
         return {
             'url': url,
             'error': str(e),
@@ -34,8 +65,11 @@ def sync_fetch_url(session, url):
         }
 
 
-def sync_fetch_multiple_urls(urls):
-    """同步获取多个URL"""
+def sync_fetch_multiple_urls(urls, compact=False):
+    """同步获取多个URL
+
+    compact=True 时每个结果都是带计时的 FetchResult。
+    """
     print("=== 同步网络请求演示 ===")
     start_time = time.time()
     
@@ -43,7 +77,7 @@ def sync_fetch_multiple_urls(urls):
         results = []
         for url in urls:
             print(f"正在请求: {url}")
-            result = sync_fetch_url(session, url)
+            result = sync_fetch_url(session, url, compact)
             results.append(result)
             print(f"完成: {url} - 状态: {result.get('status', 'ERROR')}")
     
@@ -54,34 +88,267 @@ def sync_fetch_multiple_urls(urls):
     return results
 
 
-# 2. 异步网络请求
-async def async_fetch_url(session, url):
-    """异步获取URL内容"""
+def sync_fetch_with_threads(urls, max_workers=10, compact=False):
+    """线程池并发的同步请求
+
+    逐个请求的同步版本对异步并不公平。这里用线程池并发执行，
+    并把 requests 的连接池调整为与线程数一致，
+    否则多出来的线程会不断新建和丢弃连接。
+    compact=True 时每个结果都是带计时的 FetchResult，可以统计单个请求的延迟。
+    """
+    print(f"=== 线程池({max_workers})同步请求演示 ===")
+    start_time = time.time()
+    
+    with requests.Session() as session:
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=max_workers, pool_maxsize=max_workers
+        )
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        
+        def fetch_in_thread(url):
+            result = sync_fetch_url(session, url, compact)
+            print(f"完成: {url} - 状态: {result.get('status', 'ERROR')}")
+            return result
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(fetch_in_thread, urls))
+    
+    end_time = time.time()
+    print(f"线程池同步请求总耗时: {end_time - start_time:.2f} 秒")
+    print(f"成功请求数: {len([r for r in results if 'status' in r])}")
+    print()
+    return results
+
+
+# 2. 共享的 HTTP 客户端（连接池）
+class FetchClient:
+    """可在所有请求函数之间共享的 HTTP 客户端
+
+    每次新建 aiohttp.ClientSession 都会重新建立 TCP/TLS 连接。
+    把一个 FetchClient 传给各个请求函数，就能在多个批次之间复用连接池，
+    并通过 stats() 观察连接的新建/复用情况。
+    """
+    
+    def __init__(self, limit=100, limit_per_host=10, keepalive_timeout=30,
+                 ttl_dns_cache=300, trace_configs=None):
+        self.limit = limit                          # 连接池总上限
+        self.limit_per_host = limit_per_host        # 每个主机的连接上限
+        self.keepalive_timeout = keepalive_timeout  # 空闲连接保活时间（秒）
+        self.ttl_dns_cache = ttl_dns_cache          # DNS 缓存时间（秒）
+        self.trace_configs = list(trace_configs or [])  # 额外的 TraceConfig
+        self.session = None
+        self.requests_sent = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+    
+    async def __aenter__(self):
+        await self.start()
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+    
+    async def start(self):
+        """创建连接池和会话"""
+        if self.session is not None:
+            return
+        
+        # 通过 TraceConfig 统计连接的新建和复用次数
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(self._on_request_start)
+        trace_config.on_connection_create_end.append(self._on_connection_create)
+        trace_config.on_connection_reuseconn.append(self._on_connection_reuse)
+        
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=self.ttl_dns_cache,
+        )
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            trace_configs=[trace_config] + self.trace_configs,
+        )
+    
+    async def close(self):
+        """关闭会话并释放所有连接"""
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+    
+    async def _on_request_start(self, session, ctx, params):
+        self.requests_sent += 1
+    
+    async def _on_connection_create(self, session, ctx, params):
+        self.connections_created += 1
+    
+    async def _on_connection_reuse(self, session, ctx, params):
+        self.connections_reused += 1
+    
+    def stats(self):
+        """返回连接复用统计"""
+        acquired = self.connections_created + self.connections_reused
+        return {
+            'requests': self.requests_sent,
+            'connections_created': self.connections_created,
+            'connections_reused': self.connections_reused,
+            'reuse_ratio': self.connections_reused / acquired if acquired else 0.0,
+        }
+
+
+@asynccontextmanager
+async def _use_session(client=None):
+    """获取会话：传入共享客户端时复用它，否则为本次调用临时创建一个"""
+    if client is not None:
+        await client.start()
+        yield client.session
+    else:
+        # 与 aiohttp.ClientSession() 的默认连接池相同：总数上限 100，不限制单个主机，
+        # 未传 client 的调用不会被 FetchClient 默认的每主机 10 个连接限住
+        async with FetchClient(limit_per_host=0) as temp_client:
+            yield temp_client.session
+
+
+# 3. 异步网络请求
+async def async_fetch_url(session, url, stream=False, chunk_size=64 * 1024,
+                          digest=None, save_dir=None, cache=None, singleflight=None,
+                          hedging=None, rate_limiter=None, compact=False,
+                          request_timeout=10, keep_body=False):
+    """异步获取URL内容
+
+    默认一次性读取整个响应体。stream=True 时按 chunk_size 分块读取：
+    只统计字节数、可选地计算摘要（digest 为 hashlib 算法名，如 'sha256'），
+    并可通过 aiofiles 把响应体直接写入 save_dir，内存中最多保留一个分块。
+    传入 cache（ResponseCache）时先查缓存，过期条目用条件请求重新验证；
+    缓存需要保存完整响应体，因此只对非 stream 模式生效。
+    传入 singleflight（SingleFlight）时，相同请求在途期间只发出一次。
+    传入 hedging（HedgingPolicy）时，慢请求会被一个备份请求"对冲"；
+    写文件的 save_dir 模式下两个请求会写同一个文件，因此不做对冲。
+    传入 rate_limiter（HostRateLimiter）时，每个真正发出的请求
+    （包括对冲请求，不包括缓存命中）都要先拿到所属主机的令牌。
+    compact=True 时返回 FetchResult，记录开始、首字节和结束的单调时钟时间；
+    cache 模式下没有首字节时间（缓存命中时根本没有发出请求）。
+    request_timeout 是单个请求的总超时（秒）。
+    keep_body=True 时在结果中保留响应体（'body'，bytes），供后续处理；
+    只对非 stream、非 cache 模式生效。
+    """
+    if singleflight is not None:
+        key = ('GET', url, stream, digest, save_dir, keep_body, compact,
+               request_timeout)
+        return await singleflight.do(key, lambda: async_fetch_url(
+            session, url, stream, chunk_size, digest, save_dir, cache,
+            hedging=hedging, rate_limiter=rate_limiter, compact=compact,
+            request_timeout=request_timeout, keep_body=keep_body
+        ))
+    if hedging is not None and save_dir is None:
+        return await _fetch_hedged(hedging, lambda: async_fetch_url(
+            session, url, stream, chunk_size, digest, save_dir, cache,
+            rate_limiter=rate_limiter, compact=compact,
+            request_timeout=request_timeout, keep_body=keep_body
+        ))
+    if cache is not None and not stream:
+        if not compact:
+            return await _fetch_with_cache(session, url, cache, rate_limiter,
+                                           request_timeout)
+        started = time.perf_counter()
+        result = await _fetch_with_cache(session, url, cache, rate_limiter,
+                                         request_timeout)
+        return FetchResult.from_dict(result, started, None, time.perf_counter())
+    if rate_limiter is not None:
+        await rate_limiter.acquire(urlsplit(url).netloc)
+    started = time.perf_counter()
     try:
-        async with session.get(url, timeout=10) as response:
-            content = await response.read()
-            return {
-                'url': url,
-                'status': response.status,
-                'size': len(content),
-                'time': time.time()
-            }
+        async with session.get(url, timeout=request_timeout) as response:
+            # 进入 async with 时响应头已经收到
+            first_byte = time.perf_counter()
+            if stream:
+                result = await _read_body_streaming(
+                    response, url, chunk_size, digest, save_dir
+                )
+            else:
+                content = await response.read()
+                result = {
+                    'url': url,
+                    'status': response.status,
+                    'size': len(content),
+                    'time': time.time()
+                }
+                if keep_body:
+                    result['body'] = content
+            if compact:
+                return FetchResult.from_dict(result, started, first_byte,
+                                             time.perf_counter())
+            return result
     except Exception as e:
+        # 超时异常的 str() 为空，用异常类型名代替
+        error = str(e) or type(e).__name__
+        if compact:
+            return FetchResult(url, error=error, started=started,
+                               finished=time.perf_counter())
         return {
             'url': url,
-            'error': str(e),
+            'error': error,
             'time': time.time()
         }
 
 
-async def async_fetch_multiple_urls(urls):
+async def _read_body_streaming(response, url, chunk_size, digest, save_dir):
+    """分块读取响应体，不在内存中保留完整内容"""
+    hasher = hashlib.new(digest) if digest else None
+    size = 0
+    path = None
+    temp_path = None
+    file = None
+    if save_dir is not None:
+        # 用 URL 的哈希作为文件名，避免非法字符；
+        # 先写入唯一的临时文件，读完后再原子替换，同一 URL 的并发请求不会写进同一个文件
+        path = os.path.join(save_dir, hashlib.sha1(url.encode()).hexdigest())
+        temp_path = f'{path}.{os.urandom(4).hex()}.tmp'
+        file = await aiofiles.open(temp_path, 'wb')
+    try:
+        try:
+            async for chunk in response.content.iter_chunked(chunk_size):
+                size += len(chunk)
+                if hasher is not None:
+                    hasher.update(chunk)
+                if file is not None:
+                    await file.write(chunk)
+        finally:
+            if file is not None:
+                await file.close()
+        if temp_path is not None:
+            os.replace(temp_path, path)
+    except BaseException:
+        # 下载失败时删除临时文件，不留下内容不完整的响应体
+        if temp_path is not None:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+        raise
+    
+    result = {
+        'url': url,
+        'status': response.status,
+        'size': size,
+        'time': time.time()
+    }
+    if hasher is not None:
+        result['digest'] = hasher.hexdigest()
+    if path is not None:
+        result['path'] = path
+    return result
+
+
+async def async_fetch_multiple_urls(urls, client=None, **fetch_options):
     """异步获取多个URL"""
     print("=== 异步网络请求演示 ===")
     start_time = time.time()
     
-    async with aiohttp.ClientSession() as session:
+    async with _use_session(client) as session:
         # 创建所有请求任务
-        tasks = [async_fetch_url(session, url) for url in urls]
+        tasks = [async_fetch_url(session, url, **fetch_options) for url in urls]
         
         # 并发执行所有请求
         results = await asyncio.gather(*tasks)
@@ -98,25 +365,103 @@ async def async_fetch_multiple_urls(urls):
     return results
 
 
-# 3. 带进度显示的异步请求
-async def async_fetch_with_progress(urls):
-    """带进度显示的异步请求"""
+# 4. 带进度显示的异步请求
+class ProgressAggregator:
+    """低开销的进度汇总
+
+    每个请求完成时只调用 record()，在内存中累加完成数、字节数和错误数，
+    不做任何 I/O；后台任务按 refresh_interval 的固定频率输出一行汇总。
+    因此无论每秒完成多少请求，终端输出的次数都是固定的。
+    fmt='json' 时每次输出一行 JSON，便于其他程序解析。
+    """
+    
+    def __init__(self, total=None, refresh_interval=0.5, fmt='text', output=None):
+        self.total = total
+        self.refresh_interval = refresh_interval
+        self.fmt = fmt
+        self.output = output if output is not None else sys.stdout
+        self.completed = 0
+        self.errors = 0
+        self.bytes = 0
+        self._started = None
+        self._task = None
+    
+    def record(self, result):
+        """记录一个完成的请求（只做计数）"""
+        self.completed += 1
+        if 'error' in result or result.get('status', 0) >= 400:
+            self.errors += 1
+        self.bytes += result.get('size') or 0
+    
+    def snapshot(self):
+        elapsed = time.perf_counter() - self._started
+        return {
+            'completed': self.completed,
+            'total': self.total,
+            'errors': self.errors,
+            'bytes': self.bytes,
+            'elapsed': round(elapsed, 3),
+            'rate': round(self.completed / elapsed, 1) if elapsed else 0.0,
+        }
+    
+    def render(self, final=False):
+        """输出一行汇总"""
+        data = self.snapshot()
+        if self.fmt == 'json':
+            self.output.write(json.dumps(data) + '\n')
+        else:
+            total = data['total'] if data['total'] is not None else '?'
+            line = (f"[{data['completed']}/{total}] 错误 {data['errors']} | "
+                    f"{data['bytes'] / 1024:.1f} KB | {data['rate']:.1f} 请求/秒")
+            # 终端上原地刷新同一行，重定向到文件时逐行输出
+            if self.output.isatty():
+                self.output.write('\r' + line + ('\n' if final else ''))
+            else:
+                self.output.write(line + '\n')
+        self.output.flush()
+    
+    async def _refresh(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            self.render()
+    
+    async def __aenter__(self):
+        self._started = time.perf_counter()
+        self._task = asyncio.create_task(self._refresh())
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self.render(final=True)
+
+
+async def async_fetch_with_progress(urls, client=None, refresh_interval=0.5,
+                                    progress_format='text', **fetch_options):
+    """带进度显示的异步请求
+
+    每个请求完成时只在内存中计数，由 ProgressAggregator 按固定频率输出汇总，
+    不再为每个 URL 打印两行。progress_format='json' 时输出机器可读的 JSON 行。
+    """
     print("=== 带进度的异步请求演示 ===")
     start_time = time.time()
     
-    async def fetch_with_progress(session, url, index, total):
-        """带进度显示的单个请求"""
-        print(f"[{index+1}/{total}] 开始请求: {url}")
-        result = await async_fetch_url(session, url)
-        print(f"[{index+1}/{total}] 完成: {url} - 状态: {result.get('status', 'ERROR')}")
+    progress = ProgressAggregator(total=len(urls), refresh_interval=refresh_interval,
+                                  fmt=progress_format)
+    
+    async def fetch_with_progress(session, url):
+        """带进度统计的单个请求"""
+        result = await async_fetch_url(session, url, **fetch_options)
+        progress.record(result)
         return result
     
-    async with aiohttp.ClientSession() as session:
-        tasks = [
-            fetch_with_progress(session, url, i, len(urls))
-            for i, url in enumerate(urls)
-        ]
-        results = await asyncio.gather(*tasks)
+    async with _use_session(client) as session:
+        async with progress:
+            tasks = [fetch_with_progress(session, url) for url in urls]
+            results = await asyncio.gather(*tasks)
     
     end_time = time.time()
     print(f"带进度异步请求总耗时: {end_time - start_time:.2f} 秒")
@@ -124,10 +469,139 @@ async def async_fetch_with_progress(urls):
     return results
 
 
-# 4. 限制并发数的异步请求
-async def async_fetch_with_semaphore(urls, max_concurrent=3):
-    """限制并发数的异步请求"""
-    print(f"=== 限制并发数({max_concurrent})的异步请求演示 ===")
+# 5. 限制并发数的异步请求
+class AdaptiveLimiter:
+    """根据延迟和错误率自动调整并发上限的限流器（AIMD）
+
+    - 请求成功且延迟正常：上限加性增长，每轮约 +1
+    - 出现错误或延迟超过基线的 latency_tolerance 倍：上限乘以 backoff
+    基线延迟按 key（通常是 URL）分别记录，取该接口 2xx 响应的最小延迟，并缓慢上浮，
+    以便在后端变化后重新学习：慢接口和快接口混在一批时，慢接口不会被快接口的
+    基线判为过载，404 之类的快速响应也不会把基线拉低。最多记录 max_baselines 个 key。
+    每轮（约一个平均延迟，至少 min_decrease_interval 秒）最多降低一次。
+    """
+    
+    def __init__(self, initial_limit=10, min_limit=1, max_limit=200,
+                 backoff=0.7, latency_tolerance=2.0, smoothing=0.2,
+                 min_decrease_interval=0.1, max_baselines=1024):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.smoothing = smoothing
+        self.min_decrease_interval = min_decrease_interval
+        self.max_baselines = max_baselines
+        self.in_flight = 0
+        self.latency_ewma = None
+        self.baselines = collections.OrderedDict()  # key -> 最小延迟
+        self.increases = 0
+        self.decreases = 0
+        self._last_decrease = 0.0
+        self._waiters = collections.deque()
+    
+    async def acquire(self):
+        """等待直到在途请求数低于当前上限"""
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            # 唤醒时名额已经由 _wake_waiters 直接转交给本等待者
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # 已拿到名额但随即被取消，把名额让给下一个等待者
+                self.in_flight -= 1
+                self._wake_waiters()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            raise
+    
+    def release(self, latency, failed=False, sample=True, key=None):
+        """归还名额，并根据本次请求的延迟和结果调整上限
+
+        sample 为假时（如 4xx 响应）本次延迟不计入平均延迟和基线；
+        key 区分不同接口的延迟基线，同一 key 的请求才互相比较
+        """
+        self.in_flight -= 1
+        # 失败的响应往往很快（如立即返回 503），同样不计入延迟
+        sample = sample and not failed
+        baseline = None
+        if sample:
+            if self.latency_ewma is None:
+                self.latency_ewma = latency
+            else:
+                self.latency_ewma += self.smoothing * (latency - self.latency_ewma)
+            baseline = self.baselines.pop(key, None)
+            # 基线缓慢上浮，避免永远停留在一次偶然的极低延迟上
+            self.baselines[key] = (latency if baseline is None
+                                   else min(baseline * 1.001, latency))
+            if len(self.baselines) > self.max_baselines:
+                self.baselines.popitem(last=False)
+        
+        overloaded = failed or (
+            baseline is not None and latency > baseline * self.latency_tolerance
+        )
+        now = time.monotonic()
+        if overloaded:
+            # 同一轮（约一个平均延迟）内只降一次，避免一批错误把上限压到底；
+            # 还没有成功请求时没有平均延迟，用本次请求的延迟，并且不短于下限
+            window = self.latency_ewma if self.latency_ewma is not None else latency
+            if now - self._last_decrease >= max(window, self.min_decrease_interval):
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self._last_decrease = now
+                self.decreases += 1
+        elif self.in_flight + 1 >= int(self.limit) or self._waiters:
+            # 只有上限真正被用满时才增长，空闲时不虚增
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self.increases += 1
+        self._wake_waiters()
+    
+    def _wake_waiters(self):
+        while self.in_flight < int(self.limit) and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                self.in_flight += 1
+    
+    def stats(self):
+        """返回当前上限等指标"""
+        return {
+            'limit': int(self.limit),
+            'in_flight': self.in_flight,
+            'latency_ewma': self.latency_ewma,
+            'baselines': len(self.baselines),
+            'increases': self.increases,
+            'decreases': self.decreases,
+        }
+
+
+def _is_overload_signal(result):
+    """判断一次请求结果是否说明后端过载（异常、超时、429 或 5xx）"""
+    if result is None or 'error' in result:
+        return True
+    return result['status'] == 429 or result['status'] >= 500
+
+
+def _is_latency_sample(result):
+    """只有 2xx 响应的延迟能代表后端的正常处理时间"""
+    return (result is not None and 'error' not in result
+            and 200 <= result['status'] < 300)
+
+
+async def async_fetch_with_semaphore(urls, max_concurrent=3, client=None,
+                                     limiter=None, **fetch_options):
+    """限制并发数的异步请求
+
+    传入 limiter（AdaptiveLimiter）时用它代替固定大小的信号量，
+    并发上限会随观测到的延迟和错误率自动调整。
+    """
+    if limiter is None:
+        print(f"=== 限制并发数({max_concurrent})的异步请求演示 ===")
+    else:
+        print(f"=== 自适应并发(初始 {int(limiter.limit)})的异步请求演示 ===")
     start_time = time.time()
     
     # 创建信号量来限制并发数
@@ -137,23 +611,53 @@ async def async_fetch_with_semaphore(urls, max_concurrent=3):
         """使用信号量限制并发的请求"""
         async with semaphore:
             print(f"开始请求: {url}")
-            result = await async_fetch_url(session, url)
+            result = await async_fetch_url(session, url, **fetch_options)
+            print(f"完成: {url} - 状态: {result.get('status', 'ERROR')}")
+            return result
+    
+    async def fetch_with_limiter(session, url):
+        """使用自适应限流器的请求"""
+        await limiter.acquire()
+        request_start = time.monotonic()
+        result = None
+        try:
+            print(f"开始请求: {url} (当前上限: {int(limiter.limit)})")
+            result = await async_fetch_url(session, url, **fetch_options)
             print(f"完成: {url} - 状态: {result.get('status', 'ERROR')}")
             return result
+        finally:
+            limiter.release(
+                time.monotonic() - request_start,
+                failed=_is_overload_signal(result),
+                sample=_is_latency_sample(result),
+                key=url
+            )
     
-    async with aiohttp.ClientSession() as session:
-        tasks = [fetch_with_semaphore(session, url) for url in urls]
+    fetch = fetch_with_semaphore if limiter is None else fetch_with_limiter
+    async with _use_session(client) as session:
+        tasks = [fetch(session, url) for url in urls]
         results = await asyncio.gather(*tasks)
     
     end_time = time.time()
     print(f"限制并发异步请求总耗时: {end_time - start_time:.2f} 秒")
+    if limiter is not None:
+        print(f"自适应限流器状态: {limiter.stats()}")
     print()
     return results
 
 
-# 5. 带超时的异步请求
-async def async_fetch_with_timeout(urls, timeout=5):
-    """带超时的异步请求"""
+# 6. 带超时的异步请求
+async def async_fetch_with_timeout(urls, timeout=5, client=None, deadline=None,
+                                   **fetch_options):
+    """带超时的异步请求
+
+    默认给每个 URL 单独套一层 asyncio.wait_for。
+    传入 deadline（秒）时改为整批截止时间模式，见 _fetch_with_deadline。
+    """
+    if deadline is not None:
+        return await _fetch_with_deadline(urls, timeout, deadline, client,
+                                          fetch_options)
+    
     print(f"=== 带超时({timeout}秒)的异步请求演示 ===")
     start_time = time.time()
     
@@ -161,7 +665,7 @@ async def async_fetch_with_timeout(urls, timeout=5):
         """带超时的单个请求"""
         try:
             result = await asyncio.wait_for(
-                async_fetch_url(session, url),
+                async_fetch_url(session, url, **fetch_options),
                 timeout=timeout
             )
             print(f"完成: {url} - 状态: {result.get('status', 'ERROR')}")
@@ -174,7 +678,7 @@ async def async_fetch_with_timeout(urls, timeout=5):
                 'time': time.time()
             }
     
-    async with aiohttp.ClientSession() as session:
+    async with _use_session(client) as session:
         tasks = [fetch_with_timeout(session, url) for url in urls]
         results = await asyncio.gather(*tasks)
     
@@ -184,44 +688,1390 @@ async def async_fetch_with_timeout(urls, timeout=5):
     return results
 
 
-# 6. 错误处理和重试机制
-async def async_fetch_with_retry(urls, max_retries=3):
-    """带重试机制的异步请求"""
-    print(f"=== 带重试机制({max_retries}次)的异步请求演示 ===")
+async def _fetch_with_deadline(urls, timeout, deadline, client, fetch_options):
+    """整批截止时间模式
+
+    整批请求共享 deadline 秒的时间预算：
+    - 每个请求的超时取 timeout 和整批剩余时间中较小的一个，
+      直接交给 aiohttp，不再额外创建 wait_for 任务
+    - 只用一个 asyncio.wait 计时，时间用完后取消所有未完成的请求
+    - 返回与 urls 一一对应的结果，未完成的标记为 'unfinished': True
+    """
+    print(f"=== 整批截止时间({deadline}秒)的异步请求演示 ===")
+    start_time = time.time()
+    loop = asyncio.get_running_loop()
+    deadline_at = loop.time() + deadline
+    
+    def unfinished(url):
+        return {
+            'url': url,
+            'error': 'Deadline exceeded',
+            'unfinished': True,
+            'time': time.time()
+        }
+    
+    async def fetch_before_deadline(session, url):
+        remaining = deadline_at - loop.time()
+        # aiohttp 把 0 视为"不限时"，因此至少保留 1 毫秒
+        request_timeout = max(0.001, min(timeout, remaining))
+        result = await async_fetch_url(session, url, request_timeout=request_timeout,
+                                       **fetch_options)
+        if 'error' in result and loop.time() >= deadline_at:
+            # 按时钟而不是错误信息判断：失败时整批预算已经用完，说明是被截止时间打断的。
+            # 不同路径的超时错误信息并不一致（缓存路径的超时错误信息为空）
+            return unfinished(url)
+        return result
+    
+    async with _use_session(client) as session:
+        tasks = [asyncio.ensure_future(fetch_before_deadline(session, url))
+                 for url in urls]
+        if tasks:
+            _, pending = await asyncio.wait(
+                tasks, timeout=max(0.0, deadline_at - loop.time())
+            )
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+    
+    results = []
+    for url, task in zip(urls, tasks):
+        result = unfinished(url) if task.cancelled() else task.result()
+        if result.get('unfinished'):
+            print(f"未完成: {url}")
+        else:
+            print(f"完成: {url} - 状态: {result.get('status', 'ERROR')}")
+        results.append(result)
+    
+    end_time = time.time()
+    print(f"整批截止时间模式总耗时: {end_time - start_time:.2f} 秒，"
+          f"未完成 {sum(1 for result in results if result.get('unfinished'))} 个")
+    print()
+    return results
+
+
+# 7. 错误处理和重试机制
+class RetryPolicy:
+    """重试策略：区分可重试/不可重试的结果，并计算指数退避时间
+
+    - 网络异常、超时，以及 408/425/429/5xx 等状态码可以重试
+    - 404 之类的 4xx 属于终态，重试也不会成功
+    - 第 n 次重试前等待 [0, min(max_delay, base_delay * 2**n)] 之间的随机时间
+      （"full jitter"），避免大量客户端同时重试
+    """
+    
+    RETRYABLE_STATUSES = frozenset({408, 425, 429, 500, 502, 503, 504})
+    
+    def __init__(self, max_retries=3, base_delay=0.5, max_delay=30.0, jitter=True,
+                 breaker_threshold=5, breaker_reset_timeout=30.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset_timeout = breaker_reset_timeout
+    
+    def classify(self, result):
+        """返回 'success'、'retry' 或 'terminal'"""
+        if 'error' in result:
+            return 'retry'
+        if result['status'] < 400:
+            return 'success'
+        if result['status'] in self.RETRYABLE_STATUSES:
+            return 'retry'
+        return 'terminal'
+    
+    def backoff(self, attempt):
+        """第 attempt 次重试前的等待时间（秒）"""
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return random.uniform(0, delay) if self.jitter else delay
+    
+    def new_breaker(self):
+        return CircuitBreaker(self.breaker_threshold, self.breaker_reset_timeout)
+
+
+class RetryBudget:
+    """批次级重试预算
+
+    每个首次请求存入 ratio 个令牌，每次重试消耗 1 个令牌，
+    因此整批的请求量最多放大到约 (1 + ratio) 倍，而不是 (1 + max_retries) 倍。
+    min_retries 保证小批次也能有少量重试机会。
+    """
+    
+    def __init__(self, ratio=0.2, min_retries=10):
+        self.ratio = ratio
+        self.tokens = float(min_retries)
+        self.retries = 0
+        self.rejected = 0
+    
+    def record_request(self):
+        self.tokens += self.ratio
+    
+    def try_spend(self):
+        """尝试为一次重试扣除令牌，预算不足时返回 False"""
+        if self.tokens >= 1:
+            self.tokens -= 1
+            self.retries += 1
+            return True
+        self.rejected += 1
+        return False
+
+
+class CircuitBreaker:
+    """单个主机的熔断器
+
+    closed：正常放行；连续失败 failure_threshold 次后进入 open。
+    open：直接拒绝请求，reset_timeout 秒后进入 half_open。
+    half_open：只放行一个探测请求，成功则恢复 closed，失败则重新 open。
+    """
+    
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+    
+    def allow_request(self):
+        if self.state == 'open':
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = 'half_open'
+            self._probe_in_flight = False
+        if self.state == 'half_open':
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+        return True
+    
+    def record_success(self):
+        self.state = 'closed'
+        self.failures = 0
+        self._probe_in_flight = False
+    
+    def record_failure(self):
+        self._probe_in_flight = False
+        self.failures += 1
+        if self.state == 'half_open' or self.failures >= self.failure_threshold:
+            self.state = 'open'
+            self.opened_at = time.monotonic()
+    
+    def abandon(self):
+        """请求被取消时调用，释放 half_open 状态下的探测名额"""
+        self._probe_in_flight = False
+
+
+async def async_fetch_with_retry(urls, max_retries=3, client=None, policy=None,
+                                 budget=None, breakers=None, **fetch_options):
+    """带重试机制的异步请求
+
+    policy: RetryPolicy，默认按 max_retries 创建
+    budget: RetryBudget，默认每批新建一个，限制整批的重试总量
+    breakers: {主机: CircuitBreaker}，传入同一个字典即可跨批次共享熔断状态
+    """
+    if policy is None:
+        policy = RetryPolicy(max_retries=max_retries)
+    if budget is None:
+        budget = RetryBudget()
+    if breakers is None:
+        breakers = {}
+    print(f"=== 带重试机制({policy.max_retries}次)的异步请求演示 ===")
     start_time = time.time()
     
     async def fetch_with_retry(session, url):
         """带重试的单个请求"""
-        for attempt in range(max_retries + 1):
+        host = urlsplit(url).netloc
+        breaker = breakers.get(host)
+        if breaker is None:
+            breaker = breakers[host] = policy.new_breaker()
+        budget.record_request()
+        
+        for attempt in range(policy.max_retries + 1):
+            if not breaker.allow_request():
+                print(f"熔断: {url} (主机 {host} 暂时不可用)")
+                return {
+                    'url': url,
+                    'error': 'Circuit open',
+                    'time': time.time()
+                }
+            
             try:
-                result = await async_fetch_url(session, url)
-                if 'status' in result and result['status'] == 200:
-                    print(f"成功: {url} (尝试 {attempt + 1})")
-                    return result
-                else:
-                    print(f"失败: {url} (尝试 {attempt + 1}) - {result.get('error', 'Unknown error')}")
-            except Exception as e:
-                print(f"异常: {url} (尝试 {attempt + 1}) - {e}")
+                result = await async_fetch_url(session, url, **fetch_options)
+            except asyncio.CancelledError:
+                breaker.abandon()
+                raise
+            outcome = policy.classify(result)
+            
+            if outcome == 'success':
+                breaker.record_success()
+                print(f"成功: {url} (尝试 {attempt + 1})")
+                return result
+            if outcome == 'terminal':
+                # 主机能正常应答，只是这个请求本身不会成功
+                breaker.record_success()
+                print(f"终止: {url} (尝试 {attempt + 1}) - 状态 {result['status']} 不可重试")
+                return result
+            
+            breaker.record_failure()
+            print(f"失败: {url} (尝试 {attempt + 1}) - "
+                  f"{result.get('error', result.get('status'))}")
             
-            if attempt < max_retries:
-                await asyncio.sleep(1)  # 等待1秒后重试
+            if attempt < policy.max_retries:
+                if not budget.try_spend():
+                    print(f"放弃: {url} - 重试预算已用完")
+                    return {
+                        'url': url,
+                        'error': 'Retry budget exhausted',
+                        'time': time.time()
+                    }
+                await asyncio.sleep(policy.backoff(attempt))
         
         return {
             'url': url,
-            'error': f'Failed after {max_retries + 1} attempts',
+            'error': f'Failed after {policy.max_retries + 1} attempts',
             'time': time.time()
         }
     
-    async with aiohttp.ClientSession() as session:
+    async with _use_session(client) as session:
         tasks = [fetch_with_retry(session, url) for url in urls]
         results = await asyncio.gather(*tasks)
     
     end_time = time.time()
     print(f"带重试异步请求总耗时: {end_time - start_time:.2f} 秒")
+    print(f"重试次数: {budget.retries}，因预算不足放弃: {budget.rejected}")
+    print()
+    return results
+
+
+# 8. 流式获取结果（边完成边产出）
+async def async_fetch_as_completed(urls, max_in_flight=100, client=None,
+                                   **fetch_options):
+    """按完成顺序逐个产出 (原始索引, 结果) 的异步迭代器
+
+    与 async_fetch_multiple_urls 不同，这里不会等最慢的请求结束才返回：
+    维护一个最多 max_in_flight 个请求的滑动窗口，每完成一个就立即 yield，
+    并从 urls 中补充下一个。urls 可以是任意可迭代对象（包括生成器），
+    因此内存中同时存在的任务和结果数量都不超过窗口大小。
+    fetch_options 会原样传给 async_fetch_url（例如 stream=True）。
+    """
+    async with _use_session(client) as session:
+        url_iter = enumerate(urls)
+        pending = {}  # Task -> 原始索引
+
+        def fill_window():
+            """把窗口补满，直到没有更多 URL"""
+            while len(pending) < max_in_flight:
+                try:
+                    index, url = next(url_iter)
+                except StopIteration:
+                    return
+                task = asyncio.create_task(
+                    async_fetch_url(session, url, **fetch_options)
+                )
+                pending[task] = index
+
+        fill_window()
+        try:
+            while pending:
+                done, _ = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    index = pending.pop(task)
+                    fill_window()
+                    yield index, task.result()
+        finally:
+            # 消费者提前退出（break 或异常）时，取消窗口内剩余的请求
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def async_fetch_streaming(urls, max_in_flight=3, client=None):
+    """流式异步请求演示"""
+    print(f"=== 流式异步请求(窗口 {max_in_flight})演示 ===")
+    start_time = time.time()
+    
+    success_count = 0
+    async for index, result in async_fetch_as_completed(urls, max_in_flight, client):
+        # 第一个响应到达就可以开始下游处理，无需等待整批完成
+        print(f"[{index}] 完成: {result['url']} - 状态: {result.get('status', 'ERROR')}"
+              f" (已用时 {time.time() - start_time:.2f} 秒)")
+        if 'status' in result:
+            success_count += 1
+    
+    end_time = time.time()
+    print(f"流式异步请求总耗时: {end_time - start_time:.2f} 秒")
+    print(f"成功请求数: {success_count}")
+    print()
+
+
+# 9. 响应缓存（TTL + LRU + 条件请求）
+class CacheEntry:
+    """一条缓存记录：请求结果、响应体和用于重新验证的 ETag/Last-Modified"""
+    
+    __slots__ = ('result', 'body', 'etag', 'last_modified', 'expires_at')
+    
+    def __init__(self, result, body, etag=None, last_modified=None, expires_at=0.0):
+        self.result = result
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires_at = expires_at
+    
+    def is_fresh(self):
+        return time.time() < self.expires_at
+    
+    def conditional_headers(self):
+        """构造条件请求头，服务器内容未变时会返回 304 而不是完整响应体"""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    """内存 LRU 响应缓存，可选磁盘二级缓存
+
+    - 内存层按条目数 max_entries 和响应体总字节数 max_bytes 做 LRU 淘汰
+    - 条目在 ttl 秒（或响应头 Cache-Control: max-age）后过期；
+      过期但带有 ETag/Last-Modified 的条目仍保留，用于发起条件请求
+    - 指定 disk_dir 时，写入内存的同时用 aiofiles 写入磁盘，
+      内存未命中时再从磁盘加载
+    """
+    
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024, ttl=300,
+                 disk_dir=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self._entries = collections.OrderedDict()
+        if disk_dir is not None:
+            os.makedirs(disk_dir, exist_ok=True)
+    
+    def ttl_for(self, headers):
+        """根据响应头计算有效期，no-store 返回 None 表示不缓存"""
+        cache_control = headers.get('Cache-Control', '').lower()
+        if 'no-store' in cache_control:
+            return None
+        for directive in cache_control.split(','):
+            name, _, value = directive.strip().partition('=')
+            if name == 'max-age' and value.isdigit():
+                return int(value)
+        return self.ttl
+    
+    async def get(self, url):
+        entry = self._entries.get(url)
+        if entry is not None:
+            self._entries.move_to_end(url)
+            return entry
+        if self.disk_dir is not None:
+            entry = await self._load_from_disk(url)
+            if entry is not None:
+                self._put_in_memory(url, entry)
+        return entry
+    
+    async def put(self, url, entry):
+        self._put_in_memory(url, entry)
+        if self.disk_dir is not None:
+            await self._save_to_disk(url, entry)
+    
+    def _put_in_memory(self, url, entry):
+        old = self._entries.pop(url, None)
+        if old is not None:
+            self.current_bytes -= len(old.body)
+        if len(entry.body) > self.max_bytes:
+            return
+        self._entries[url] = entry
+        self.current_bytes += len(entry.body)
+        # 淘汰最久未使用的条目，直到满足条目数和字节数限制
+        while (len(self._entries) > self.max_entries
+               or self.current_bytes > self.max_bytes):
+            _, evicted = self._entries.popitem(last=False)
+            self.current_bytes -= len(evicted.body)
+    
+    def _disk_path(self, url):
+        return os.path.join(self.disk_dir, hashlib.sha1(url.encode()).hexdigest())
+    
+    async def _save_to_disk(self, url, entry):
+        # 文件格式：第一行是 JSON 元数据（包含响应体长度），其余是原始响应体
+        meta = {
+            'result': entry.result,
+            'etag': entry.etag,
+            'last_modified': entry.last_modified,
+            'expires_at': entry.expires_at,
+            'body_size': len(entry.body),
+        }
+        # 先写临时文件再原子替换，写到一半中断时不会留下内容不完整的缓存文件
+        path = self._disk_path(url)
+        temp_path = f'{path}.{os.urandom(4).hex()}.tmp'
+        try:
+            async with aiofiles.open(temp_path, 'wb') as file:
+                await file.write(json.dumps(meta).encode() + b'\n' + entry.body)
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+    
+    async def _load_from_disk(self, url):
+        try:
+            async with aiofiles.open(self._disk_path(url), 'rb') as file:
+                data = await file.read()
+        except FileNotFoundError:
+            return None
+        header, _, body = data.partition(b'\n')
+        try:
+            meta = json.loads(header)
+            if len(body) != meta['body_size']:
+                return None  # 内容不完整，当作未命中
+            return CacheEntry(meta['result'], body, meta['etag'],
+                              meta['last_modified'], meta['expires_at'])
+        except (ValueError, KeyError, TypeError):
+            # 损坏或旧格式的缓存文件，当作未命中，之后会被新内容覆盖
+            return None
+    
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'bytes': self.current_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'revalidated': self.revalidated,
+        }
+
+
+async def _fetch_with_cache(session, url, cache, rate_limiter=None,
+                            request_timeout=10):
+    """先查缓存，新鲜则直接返回；过期则发条件请求，304 时沿用缓存内容"""
+    try:
+        # 磁盘缓存的读取错误也和请求错误一样作为错误结果返回
+        entry = await cache.get(url)
+        if entry is not None and entry.is_fresh():
+            cache.hits += 1
+            return dict(entry.result, time=time.time(), cache='hit')
+        
+        if rate_limiter is not None:
+            await rate_limiter.acquire(urlsplit(url).netloc)
+        headers = entry.conditional_headers() if entry is not None else {}
+        async with session.get(url, timeout=request_timeout,
+                               headers=headers) as response:
+            if response.status == 304 and entry is not None:
+                cache.revalidated += 1
+                ttl = cache.ttl_for(response.headers)
+                entry.expires_at = time.time() + (ttl or 0)
+                await cache.put(url, entry)
+                return dict(entry.result, time=time.time(), cache='revalidated')
+            
+            content = await response.read()
+            cache.misses += 1
+            result = {
+                'url': url,
+                'status': response.status,
+                'size': len(content),
+            }
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+            ttl = cache.ttl_for(response.headers)
+            if response.status == 200 and ttl is not None:
+                await cache.put(url, CacheEntry(
+                    result, content, etag, last_modified, time.time() + ttl
+                ))
+            return dict(result, time=time.time(), cache='miss')
+    except Exception as e:
+        return {
+            'url': url,
+            'error': str(e) or type(e).__name__,
+            'time': time.time()
+        }
+
+
+async def async_fetch_with_cache(urls, cache, rounds=2, client=None):
+    """响应缓存演示：同一批 URL 连续请求多轮"""
+    print("=== 响应缓存演示 ===")
+    
+    async with _use_session(client) as session:
+        for round_index in range(rounds):
+            start_time = time.time()
+            tasks = [async_fetch_url(session, url, cache=cache) for url in urls]
+            results = await asyncio.gather(*tasks)
+            sources = collections.Counter(r.get('cache', 'error') for r in results)
+            print(f"第 {round_index + 1} 轮: 耗时 {time.time() - start_time:.2f} 秒，"
+                  f"来源 {dict(sources)}")
+    
+    print(f"缓存统计: {cache.stats()}")
+    print()
+
+
+# 10. 合并重复的在途请求（single-flight）
+class _InFlightCall:
+    __slots__ = ('task', 'waiters')
+    
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """合并相同 key 的并发调用
+
+    某个 key 的请求还在进行时，后来的调用者不再发出新请求，
+    而是等待同一个结果。请求完成后立即移除记录，因此不具备缓存语义：
+    之后的调用会重新发起请求。
+    """
+    
+    def __init__(self):
+        self.executed = 0   # 实际发出的调用次数
+        self.coalesced = 0  # 被合并掉的调用次数
+        self._calls = {}
+    
+    async def do(self, key, func):
+        """执行 func()，或等待同一 key 正在进行的调用"""
+        call = self._calls.get(key)
+        if call is None:
+            call = _InFlightCall(asyncio.ensure_future(func()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+            self.executed += 1
+            shared = False
+        else:
+            self.coalesced += 1
+            shared = True
+        
+        call.waiters += 1
+        try:
+            # shield：某个调用者被取消时，不影响其他仍在等待的调用者
+            result = await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # 立即移除记录：任务要到下一轮事件循环才真正结束，
+                # 这期间到达的调用者不能加入一个注定被取消的调用
+                self._forget(key, call)
+                call.task.cancel()
+        # 每个调用者拿到独立的副本，避免互相修改
+        return _with_fields(result, shared=True) if shared else _with_fields(result)
+    
+    def _forget(self, key, call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+    
+    def stats(self):
+        return {'executed': self.executed, 'coalesced': self.coalesced}
+
+
+async def async_fetch_deduplicated(urls, client=None):
+    """合并重复请求演示"""
+    print("=== 合并重复请求演示 ===")
+    start_time = time.time()
+    
+    singleflight = SingleFlight()
+    results = await async_fetch_multiple_urls(
+        urls, client=client, singleflight=singleflight
+    )
+    
+    print(f"URL 数: {len(urls)}，实际请求数: {singleflight.executed}，"
+          f"合并: {singleflight.coalesced}")
+    print(f"合并重复请求总耗时: {time.time() - start_time:.2f} 秒")
+    print()
+    return results
+
+
+# 11. 对冲请求（降低长尾延迟）
+class HedgingPolicy:
+    """对冲请求策略
+
+    请求在 hedge_delay()（最近延迟的 percentile 分位数）内还没有返回，
+    就再发一个相同的备份请求，谁先返回用谁，另一个被取消。
+    对冲请求数不超过总请求数的 max_hedge_ratio，避免在后端整体变慢时翻倍加压。
+    样本不足 min_samples 时使用 initial_delay。
+    """
+    
+    def __init__(self, percentile=0.95, max_hedge_ratio=0.05, initial_delay=1.0,
+                 min_samples=20, window=1000):
+        self.percentile = percentile
+        self.max_hedge_ratio = max_hedge_ratio
+        self.initial_delay = initial_delay
+        self.min_samples = min_samples
+        self.requests = 0
+        self.hedges = 0
+        self.hedges_won = 0
+        self._latencies = collections.deque(maxlen=window)
+        self._delay = initial_delay
+        self._samples_since_update = 0
+    
+    def record_latency(self, latency):
+        self._latencies.append(latency)
+        self._samples_since_update += 1
+        # 分位数需要排序，每积累一批样本才重新计算一次
+        if (len(self._latencies) >= self.min_samples
+                and self._samples_since_update >= 32):
+            ordered = sorted(self._latencies)
+            self._delay = ordered[int(self.percentile * (len(ordered) - 1))]
+            self._samples_since_update = 0
+    
+    def hedge_delay(self):
+        if len(self._latencies) < self.min_samples:
+            return self.initial_delay
+        return self._delay
+    
+    def try_hedge(self):
+        """对冲额度还有剩余时返回 True 并计数"""
+        if self.hedges + 1 > self.requests * self.max_hedge_ratio:
+            return False
+        self.hedges += 1
+        return True
+    
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'hedges': self.hedges,
+            'hedges_won': self.hedges_won,
+            'hedge_delay': self.hedge_delay(),
+        }
+
+
+async def _fetch_hedged(hedging, fetch):
+    """发出主请求，超过对冲延迟仍未返回时再发备份请求，取先完成者"""
+    hedging.requests += 1
+    
+    async def timed_fetch():
+        request_start = time.monotonic()
+        result = await fetch()
+        if 'error' not in result:
+            hedging.record_latency(time.monotonic() - request_start)
+        return result
+    
+    primary = asyncio.ensure_future(timed_fetch())
+    tasks = {primary}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=hedging.hedge_delay())
+        if done or not hedging.try_hedge():
+            return await primary
+        
+        backup = asyncio.ensure_future(timed_fetch())
+        tasks.add(backup)
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            # 两个请求同时完成时优先取成功的结果
+            winner = min(done, key=lambda task: 'error' in task.result())
+            # 先返回的是错误而另一个仍在进行时，继续等另一个
+            if 'error' not in winner.result() or not pending:
+                break
+        if winner is backup:
+            hedging.hedges_won += 1
+        return _with_fields(winner.result(), hedged=True)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def async_fetch_hedged(urls, hedging=None, client=None):
+    """对冲请求演示"""
+    if hedging is None:
+        hedging = HedgingPolicy(initial_delay=0.5, max_hedge_ratio=0.25)
+    print("=== 对冲请求演示 ===")
+    start_time = time.time()
+    
+    results = await async_fetch_multiple_urls(urls, client=client, hedging=hedging)
+    
+    print(f"对冲统计: {hedging.stats()}")
+    print(f"对冲请求总耗时: {time.time() - start_time:.2f} 秒")
     print()
     return results
 
 
+# 12. 按主机的令牌桶限速
+class _TokenBucket:
+    __slots__ = ('tokens', 'updated', 'rate', 'burst')
+    
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = now
+    
+    def reserve(self, now):
+        """预订一个令牌，返回需要等待的秒数
+
+        令牌数允许变成负数：负数表示已经被排队的请求预订掉的未来令牌，
+        因此同一主机的请求天然按到达顺序排队。
+        """
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+    
+    def is_full(self, now):
+        """到 now 为止令牌是否已经补满（预订掉的未来令牌都已还清）"""
+        return self.tokens + (now - self.updated) * self.rate >= self.burst
+
+
+class HostRateLimiter:
+    """按主机限速：每个主机一个令牌桶（每秒 rate 个，最多积攒 burst 个）
+
+    令牌按时间差惰性补充，不需要为每个主机运行定时任务。
+    所有需要等待的请求放进同一个按唤醒时间排序的堆里，
+    整个限速器只用一个 loop.call_at 定时器按时唤醒它们，
+    因此上千个主机的开销也只是堆操作。
+    host_limits 可以为个别主机指定 {主机: (rate, burst)}。
+    """
+    
+    def __init__(self, rate=10.0, burst=10, host_limits=None, idle_timeout=60.0):
+        self.rate = rate
+        self.burst = burst
+        self.host_limits = host_limits or {}
+        self.idle_timeout = idle_timeout
+        self.granted = 0
+        self.delayed = 0
+        self._buckets = {}
+        self._heap = []  # (唤醒时间, 序号, Future)
+        self._seq = 0
+        self._timer = None
+        self._last_cleanup = 0.0
+    
+    async def acquire(self, host):
+        """等待直到 host 有可用令牌"""
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        self._cleanup_idle(now)
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            rate, burst = self.host_limits.get(host, (self.rate, self.burst))
+            bucket = self._buckets[host] = _TokenBucket(rate, burst, now)
+        
+        wait = bucket.reserve(now)
+        self.granted += 1
+        if wait <= 0:
+            return
+        
+        self.delayed += 1
+        waiter = loop.create_future()
+        self._seq += 1
+        heapq.heappush(self._heap, (now + wait, self._seq, waiter))
+        self._schedule(loop)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            # 归还预订的令牌，后来的请求可以用上
+            bucket.tokens += 1
+            raise
+    
+    def _schedule(self, loop):
+        """让唯一的定时器指向堆顶（最早需要唤醒）的等待者"""
+        if not self._heap:
+            return
+        when = self._heap[0][0]
+        if self._timer is not None:
+            if self._timer.when() <= when:
+                return
+            self._timer.cancel()
+        self._timer = loop.call_at(when, self._wake_due, loop)
+    
+    def _wake_due(self, loop):
+        self._timer = None
+        now = loop.time()
+        while self._heap and self._heap[0][0] <= now:
+            _, _, waiter = heapq.heappop(self._heap)
+            if not waiter.done():
+                waiter.set_result(None)
+        self._schedule(loop)
+    
+    def _cleanup_idle(self, now):
+        """定期丢弃长时间未使用且令牌已经补满的主机，丢弃后重建的桶与原来等价
+
+        只看最后一次预订的时间不够：排队很长的主机可能还欠着更远的未来令牌，
+        丢弃它会让下一个请求拿到一个新的满桶，绕过限速。
+        """
+        if now - self._last_cleanup < self.idle_timeout:
+            return
+        self._last_cleanup = now
+        idle = [host for host, bucket in self._buckets.items()
+                if now - bucket.updated > self.idle_timeout and bucket.is_full(now)]
+        for host in idle:
+            del self._buckets[host]
+    
+    def stats(self):
+        return {
+            'hosts': len(self._buckets),
+            'granted': self.granted,
+            'delayed': self.delayed,
+            'waiting': len(self._heap),
+        }
+
+
+async def async_fetch_rate_limited(urls, rate=2.0, burst=2, client=None):
+    """按主机限速的请求演示"""
+    print(f"=== 按主机限速(每秒 {rate} 个, 突发 {burst} 个)的异步请求演示 ===")
+    start_time = time.time()
+    
+    rate_limiter = HostRateLimiter(rate=rate, burst=burst)
+    results = await async_fetch_multiple_urls(
+        urls, client=client, rate_limiter=rate_limiter
+    )
+    
+    print(f"限速统计: {rate_limiter.stats()}")
+    print(f"限速异步请求总耗时: {time.time() - start_time:.2f} 秒")
+    print()
+    return results
+
+
+# 13. 同步、线程池与异步的对比
+async def compare_fetch_modes(urls, concurrency=10):
+    """在相同并发数下对比顺序同步、线程池同步和异步请求
+
+    除了耗时和吞吐量，还用 tracemalloc 统计内存峰值，
+    并折算成每个在途请求的内存，用来判断线程是否"够用"。
+    每种模式运行两遍：第一遍只计时，第二遍只统计内存，
+    因为 tracemalloc 会明显拖慢 Python 代码，对各模式的影响也不一样。
+    线程池每次新建 Session，异步版本也每次新建 FetchClient，两边都从冷连接池开始。
+    """
+    print(f"=== 同步 / 线程池 / 异步 对比(并发 {concurrency}) ===")
+    
+    async def run_async():
+        async with FetchClient(limit=concurrency,
+                               limit_per_host=concurrency) as fresh_client:
+            return await async_fetch_with_semaphore(
+                urls, max_concurrent=concurrency, client=fresh_client
+            )
+    
+    async def run_quietly(run):
+        # 丢弃各演示函数自己的逐条打印，只保留对比结果
+        with redirect_stdout(io.StringIO()):
+            results = run()
+            if asyncio.iscoroutine(results):
+                results = await results
+        return results
+    
+    modes = [
+        ('同步顺序', 1, lambda: sync_fetch_multiple_urls(urls)),
+        ('线程池', concurrency, lambda: sync_fetch_with_threads(urls, concurrency)),
+        ('异步', concurrency, run_async),
+    ]
+    
+    print(f"{'模式':<8}{'耗时(秒)':>10}{'吞吐量(请求/秒)':>16}"
+          f"{'内存峰值(KB)':>14}{'每个在途请求(KB)':>18}")
+    for name, max_in_flight, run in modes:
+        start_time = time.perf_counter()
+        results = await run_quietly(run)
+        elapsed = time.perf_counter() - start_time
+        
+        tracemalloc.start()
+        try:
+            await run_quietly(run)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        
+        in_flight = min(max_in_flight, len(urls)) or 1
+        print(f"{name:<8}{elapsed:>12.2f}{len(results) / elapsed:>18.1f}"
+              f"{peak / 1024:>16.1f}{peak / 1024 / in_flight:>20.1f}")
+    print()
+
+
+# 14. 紧凑的结果记录与列式批量存储
+class FetchResult:
+    """紧凑的单个请求结果
+
+    用 __slots__ 代替字典，每条结果省去字典的哈希表开销。
+    时间字段来自 time.perf_counter()（单调时钟），可以直接相减得到：
+    latency = finished - started，ttfb = first_byte - started。
+    同时支持 result['status']、'error' in result、result.get(...) 等字典式读取，
+    因此可以直接交给原来处理字典结果的代码。
+    """
+    
+    __slots__ = ('url', 'status', 'size', 'error', 'started', 'first_byte',
+                 'finished', 'extra')
+    
+    def __init__(self, url, status=None, size=None, error=None, started=None,
+                 first_byte=None, finished=None, extra=None):
+        self.url = url
+        self.status = status
+        self.size = size
+        self.error = error
+        self.started = started
+        self.first_byte = first_byte
+        self.finished = finished
+        self.extra = extra  # digest、path 等可选字段，没有时为 None
+    
+    @classmethod
+    def from_dict(cls, result, started, first_byte, finished):
+        extra = {key: value for key, value in result.items()
+                 if key not in ('url', 'status', 'size', 'error', 'time')}
+        return cls(result['url'], result.get('status'), result.get('size'),
+                   result.get('error'), started, first_byte, finished,
+                   extra or None)
+    
+    @property
+    def latency(self):
+        if self.started is None or self.finished is None:
+            return None
+        return self.finished - self.started
+    
+    @property
+    def ttfb(self):
+        if self.started is None or self.first_byte is None:
+            return None
+        return self.first_byte - self.started
+    
+    def with_extra(self, **fields):
+        """返回附加了额外字段的副本"""
+        extra = dict(self.extra or {}, **fields)
+        return FetchResult(self.url, self.status, self.size, self.error,
+                           self.started, self.first_byte, self.finished, extra)
+    
+    # 字典式读取，兼容原有代码
+    def keys(self):
+        keys = [name for name in ('url', 'status', 'size', 'error')
+                if getattr(self, name) is not None]
+        if self.latency is not None:
+            keys.append('latency')
+        if self.extra:
+            keys.extend(self.extra)
+        return keys
+    
+    def __getitem__(self, key):
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        if key in ('url', 'status', 'size', 'error', 'latency', 'ttfb'):
+            value = getattr(self, key)
+            if value is not None:
+                return value
+        raise KeyError(key)
+    
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+    
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+    
+    def __repr__(self):
+        fields = ', '.join(f'{key}={self[key]!r}' for key in self.keys())
+        return f'FetchResult({fields})'
+
+
+def _with_fields(result, **fields):
+    """复制一条结果并附加字段，字典和 FetchResult 都适用"""
+    if isinstance(result, FetchResult):
+        return result.with_extra(**fields)
+    return dict(result, **fields)
+
+
+class ResultColumns:
+    """列式存储一整批结果
+
+    每一列是一个 array.array，一条结果只占几个定长数值，
+    百万条结果也不会产生百万个字典或对象。错误很少，单独存放在字典里。
+    缺失的数值用 -1（状态码、大小）或 nan（时间）表示。
+    """
+    
+    def __init__(self):
+        self.urls = []
+        self.status = array.array('h')
+        self.size = array.array('q')
+        self.started = array.array('d')
+        self.first_byte = array.array('d')
+        self.finished = array.array('d')
+        self.errors = {}  # 索引 -> 错误信息
+    
+    def __len__(self):
+        return len(self.urls)
+    
+    def append(self, result):
+        """追加一条结果（FetchResult 或字典）"""
+        nan = float('nan')
+        
+        def timing(name):
+            value = getattr(result, name, None)
+            return nan if value is None else value
+        
+        if 'error' in result:
+            self.errors[len(self.urls)] = result['error']
+        self.urls.append(result['url'])
+        self.status.append(result.get('status', -1))
+        self.size.append(result.get('size', -1))
+        self.started.append(timing('started'))
+        self.first_byte.append(timing('first_byte'))
+        self.finished.append(timing('finished'))
+    
+    def __getitem__(self, index):
+        """把第 index 行还原为 FetchResult"""
+        def value(column, missing):
+            item = column[index]
+            return None if item == missing or item != item else item
+        
+        return FetchResult(
+            self.urls[index],
+            status=value(self.status, -1),
+            size=value(self.size, -1),
+            error=self.errors.get(index),
+            started=value(self.started, None),
+            first_byte=value(self.first_byte, None),
+            finished=value(self.finished, None),
+        )
+    
+    def latencies(self):
+        """所有有计时的结果的延迟（秒）"""
+        return [end - start for start, end in zip(self.started, self.finished)
+                if end == end and start == start]
+    
+    def summary(self):
+        """整批结果的计数和延迟分位数"""
+        latencies = sorted(self.latencies())
+        ttfbs = sorted(fb - start for start, fb in zip(self.started, self.first_byte)
+                       if fb == fb and start == start)
+        
+        def pick(values, fraction):
+            if not values:
+                return None
+            return round(values[min(len(values) - 1, int(fraction * len(values)))] * 1000, 2)
+        
+        return {
+            'count': len(self),
+            'errors': len(self.errors),
+            'bytes': sum(size for size in self.size if size > 0),
+            'latency_ms': {'p50': pick(latencies, 0.5), 'p99': pick(latencies, 0.99)},
+            'ttfb_ms': {'p50': pick(ttfbs, 0.5), 'p99': pick(ttfbs, 0.99)},
+        }
+
+
+async def async_fetch_compact(urls, max_in_flight=10, client=None):
+    """紧凑结果演示：流式获取结果并写入列式存储"""
+    print("=== 紧凑结果记录演示 ===")
+    
+    columns = ResultColumns()
+    async for _, result in async_fetch_as_completed(
+            urls, max_in_flight, client=client, compact=True):
+        columns.append(result)
+    
+    print(f"第一条结果: {columns[0]!r}")
+    print(f"批次统计: {columns.summary()}")
+    print()
+    return columns
+
+
+# 15. 请求分阶段计时（aiohttp TraceConfig）
+class LatencyHistogram:
+    """按 2 的幂分桶的延迟直方图，内存占用固定，与样本数无关"""
+    
+    # 桶上界：0.1ms, 0.2ms, 0.4ms ... 约 105 秒
+    BOUNDS = [0.0001 * 2 ** i for i in range(21)]
+    
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+    
+    def record(self, value):
+        self.counts[bisect.bisect_left(self.BOUNDS, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+    
+    def percentile(self, fraction):
+        """返回分位数所在桶的上界（近似值）"""
+        if not self.count:
+            return None
+        target = fraction * self.count
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts):
+            cumulative += bucket_count
+            if cumulative >= target:
+                if index < len(self.BOUNDS):
+                    return min(self.BOUNDS[index], self.max)
+                return self.max
+        return self.max
+    
+    def summary(self):
+        def ms(value):
+            return None if value is None else round(value * 1000, 2)
+        return {
+            'count': self.count,
+            'mean_ms': ms(self.total / self.count) if self.count else None,
+            'p50_ms': ms(self.percentile(0.50)),
+            'p95_ms': ms(self.percentile(0.95)),
+            'p99_ms': ms(self.percentile(0.99)),
+            'max_ms': ms(self.max),
+        }
+
+
+class PhaseTracer:
+    """用 aiohttp TraceConfig 记录每个请求各阶段的耗时，并按主机汇总成直方图
+
+    阶段划分：
+    - pool_wait：连接池已满时排队等待连接的时间
+    - dns：DNS 解析（命中 DNS 缓存时为 0）
+    - connect：建立新连接，包括 TCP 握手和 TLS 握手
+      （aiohttp 没有单独的 TLS 信号，两者无法拆开）
+    - ttfb：请求头发出到收到响应头，主要是服务器处理时间
+    - body：收到响应头到响应体接收完毕
+    - total：整个请求
+    复用连接时没有 dns/connect 阶段，只记录实际发生的阶段。
+    """
+    
+    PHASES = ('pool_wait', 'dns', 'connect', 'ttfb', 'body', 'total')
+    
+    def __init__(self):
+        self.hosts = {}   # 主机 -> {阶段: LatencyHistogram}
+        self.errors = collections.Counter()
+    
+    def _histograms(self, host):
+        histograms = self.hosts.get(host)
+        if histograms is None:
+            histograms = self.hosts[host] = {
+                phase: LatencyHistogram() for phase in self.PHASES
+            }
+        return histograms
+    
+    def trace_config(self):
+        """创建 TraceConfig，传给 FetchClient(trace_configs=[...]) 使用"""
+        def now():
+            return asyncio.get_running_loop().time()
+        
+        async def on_request_start(session, ctx, params):
+            ctx.start = now()
+            ctx.phases = {}
+        
+        async def on_queued_start(session, ctx, params):
+            ctx.queued = now()
+        
+        async def on_queued_end(session, ctx, params):
+            ctx.phases['pool_wait'] = now() - ctx.queued
+        
+        async def on_create_start(session, ctx, params):
+            ctx.create = now()
+        
+        async def on_create_end(session, ctx, params):
+            # 新建连接的耗时包含 DNS 解析，这里扣除
+            elapsed = now() - ctx.create
+            ctx.phases['connect'] = elapsed - ctx.phases.get('dns', 0.0)
+        
+        async def on_dns_start(session, ctx, params):
+            ctx.dns = now()
+        
+        async def on_dns_end(session, ctx, params):
+            ctx.phases['dns'] = now() - ctx.dns
+        
+        async def on_headers_sent(session, ctx, params):
+            ctx.headers_sent = now()
+        
+        async def on_request_end(session, ctx, params):
+            response_at = now()
+            if hasattr(ctx, 'headers_sent'):
+                ctx.phases['ttfb'] = response_at - ctx.headers_sent
+            histograms = self._histograms(params.url.host)
+            
+            def on_body_done():
+                # 响应体从网络上接收完毕时调用，与应用何时读取无关
+                done_at = asyncio.get_running_loop().time()
+                ctx.phases['body'] = done_at - response_at
+                ctx.phases['total'] = done_at - ctx.start
+                for phase, value in ctx.phases.items():
+                    histograms[phase].record(value)
+            
+            params.response.content.on_eof(on_body_done)
+        
+        async def on_request_exception(session, ctx, params):
+            self._histograms(params.url.host)
+            self.errors[params.url.host] += 1
+        
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_connection_queued_start.append(on_queued_start)
+        trace_config.on_connection_queued_end.append(on_queued_end)
+        trace_config.on_connection_create_start.append(on_create_start)
+        trace_config.on_connection_create_end.append(on_create_end)
+        trace_config.on_dns_resolvehost_start.append(on_dns_start)
+        trace_config.on_dns_resolvehost_end.append(on_dns_end)
+        trace_config.on_request_headers_sent.append(on_headers_sent)
+        trace_config.on_request_end.append(on_request_end)
+        trace_config.on_request_exception.append(on_request_exception)
+        return trace_config
+    
+    def dump(self):
+        """按主机、阶段输出直方图摘要，可直接 json.dumps"""
+        return {
+            host: {
+                'errors': self.errors.get(host, 0),
+                **{phase: histogram.summary()
+                   for phase, histogram in histograms.items() if histogram.count},
+            }
+            for host, histograms in self.hosts.items()
+        }
+    
+    def print_report(self):
+        for host, phases in self.dump().items():
+            print(f"主机 {host} (错误 {phases.pop('errors')}):")
+            for phase, summary in phases.items():
+                print(f"  {phase:<10} 次数 {summary['count']:>5}  "
+                      f"p50 {summary['p50_ms']:>8} ms  p99 {summary['p99_ms']:>8} ms")
+
+
+async def async_fetch_with_phase_timing(urls, limit_per_host=2):
+    """分阶段计时演示
+
+    连接池故意设得很小，可以从 pool_wait 看出排队等待连接的时间。
+    """
+    print(f"=== 分阶段计时演示(每主机 {limit_per_host} 个连接) ===")
+    
+    tracer = PhaseTracer()
+    async with FetchClient(limit_per_host=limit_per_host,
+                           trace_configs=[tracer.trace_config()]) as client:
+        with redirect_stdout(io.StringIO()):
+            await async_fetch_multiple_urls(urls, client=client)
+    
+    tracer.print_report()
+    print()
+    return tracer
+
+
+# 16. 有界的生产者/消费者流水线
+async def iter_urls_from_file(path, encoding='utf-8'):
+    """逐行读取 URL 文件，跳过空行和以 # 开头的注释行
+
+    用 aiofiles 按行读取，不会把整个文件读入内存。
+    """
+    async with aiofiles.open(path, encoding=encoding) as file:
+        async for line in file:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield line
+
+
+async def _aiter_urls(source):
+    """把 URL 来源统一成异步迭代器：异步迭代器、文件路径或普通可迭代对象"""
+    if isinstance(source, (str, os.PathLike)):
+        source = iter_urls_from_file(source)
+    if hasattr(source, '__aiter__'):
+        async for url in source:
+            yield url
+    else:
+        for url in source:
+            yield url
+
+
+class FetchPipeline:
+    """有界的生产者/消费者流水线
+
+    source -> [有界队列] -> workers 个工作协程 -> sink
+
+    - 生产者从 source 读取 URL 放入最多 queue_size 项的队列，队列满时暂停读取
+    - 固定数量的工作协程从队列中取 URL 发起请求，再把结果交给 sink(index, result)
+    - sink 是协程函数；sink 变慢时工作协程被阻塞，队列随之填满，生产者停止读取，
+      背压一直传递到 URL 来源
+
+    同时存在的协程数固定为 workers + 1，而不是每个 URL 一个，
+    因此无论输入 1 千还是 1 亿个 URL，内存占用都基本不变。
+    fetch_options 会原样传给 async_fetch_url。
+    """
+    
+    def __init__(self, workers=10, queue_size=None, client=None, **fetch_options):
+        self.workers = workers
+        self.queue_size = queue_size or workers * 2
+        self.client = client
+        self.fetch_options = fetch_options
+        self.stats = {}
+    
+    async def run(self, source, sink=None):
+        """处理 source 中的所有 URL，返回统计信息
+
+        source 可以是异步迭代器、URL 文件路径或普通可迭代对象（包括生成器）。
+        sink 抛出异常时，流水线立即停止，异常原样抛给调用方。
+        """
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        stats = self.stats = {
+            'produced': 0,
+            'completed': 0,
+            'errors': 0,
+            'producer_waits': 0,  # 队列已满、生产者被背压阻塞的次数
+        }
+        
+        async def produce():
+            async for url in _aiter_urls(source):
+                if queue.full():
+                    stats['producer_waits'] += 1
+                await queue.put((stats['produced'], url))
+                stats['produced'] += 1
+            # 每个工作协程一个结束标记
+            for _ in range(self.workers):
+                await queue.put(None)
+        
+        async def consume(session):
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                index, url = item
+                result = await async_fetch_url(session, url, **self.fetch_options)
+                if 'error' in result:
+                    stats['errors'] += 1
+                if sink is not None:
+                    await sink(index, result)
+                stats['completed'] += 1
+        
+        async with _use_session(self.client) as session:
+            tasks = [asyncio.ensure_future(produce())]
+            tasks += [asyncio.ensure_future(consume(session))
+                      for _ in range(self.workers)]
+            try:
+                await asyncio.gather(*tasks)
+            finally:
+                # 任一环节出错时停止其余协程
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+        
+        return stats
+
+
+async def async_fetch_pipeline(urls, workers=3, client=None):
+    """流水线模式演示：从文件读取 URL，结果交给一个较慢的 sink"""
+    print(f"=== 流水线模式演示({workers} 个工作协程) ===")
+    start_time = time.time()
+    
+    async def slow_sink(index, result):
+        # 模拟写数据库等较慢的下游，流水线会相应地放慢读取速度
+        await asyncio.sleep(0.1)
+        print(f"[{index}] 完成: {result['url']} - 状态: {result.get('status', 'ERROR')}")
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        url_file = os.path.join(temp_dir, 'urls.txt')
+        async with aiofiles.open(url_file, 'w') as file:
+            await file.write('\n'.join(urls) + '\n')
+        
+        pipeline = FetchPipeline(workers=workers, queue_size=workers, client=client)
+        stats = await pipeline.run(url_file, slow_sink)
+    
+    end_time = time.time()
+    print(f"流水线模式总耗时: {end_time - start_time:.2f} 秒")
+    print(f"统计: {stats}")
+    print()
+    return stats
+
+
 async def main():
     """主函数：演示各种异步网络请求方式"""
     # 测试URL列表
@@ -241,20 +2091,79 @@ async def main():
     # 1. 同步请求（对比）
     sync_results = sync_fetch_multiple_urls(test_urls[:3])  # 只测试前3个
     
-    # 2. 基本异步请求
-    async_results = await async_fetch_multiple_urls(test_urls)
-    
-    # 3. 带进度的异步请求
-    progress_results = await async_fetch_with_progress(test_urls[:4])
-    
-    # 4. 限制并发数的异步请求
-    semaphore_results = await async_fetch_with_semaphore(test_urls, max_concurrent=2)
-    
-    # 5. 带超时的异步请求
-    timeout_results = await async_fetch_with_timeout(test_urls, timeout=3)
+    # 所有异步请求共享同一个客户端，在批次之间复用连接
+    async with FetchClient(limit_per_host=10, keepalive_timeout=30) as client:
+        # 2. 基本异步请求
+        async_results = await async_fetch_multiple_urls(test_urls, client=client)
+        
+        # 3. 带进度的异步请求
+        progress_results = await async_fetch_with_progress(test_urls[:4], client=client)
+        
+        # 4. 限制并发数的异步请求
+        semaphore_results = await async_fetch_with_semaphore(
+            test_urls, max_concurrent=2, client=client
+        )
+        
+        # 4.1 自适应并发：上限随延迟和错误率自动调整
+        adaptive_results = await async_fetch_with_semaphore(
+            test_urls, client=client,
+            limiter=AdaptiveLimiter(initial_limit=2, max_limit=8)
+        )
+        
+        # 5. 带超时的异步请求
+        timeout_results = await async_fetch_with_timeout(test_urls, timeout=3, client=client)
+        
+        # 5.1 整批截止时间：整批最多 1.5 秒，超时的请求被取消并标记
+        deadline_results = await async_fetch_with_timeout(
+            test_urls, timeout=3, deadline=1.5, client=client
+        )
+        
+        # 6. 带重试的异步请求
+        retry_results = await async_fetch_with_retry(test_urls[:3], max_retries=2, client=client)
+        
+        # 7. 流式获取结果
+        await async_fetch_streaming(test_urls, max_in_flight=3, client=client)
+        
+        # 8. 分块读取响应体：计算摘要并直接写入磁盘
+        print("=== 分块读取响应体演示 ===")
+        with tempfile.TemporaryDirectory() as save_dir:
+            body_results = await async_fetch_multiple_urls(
+                test_urls[-2:], client=client,
+                stream=True, digest='sha256', save_dir=save_dir
+            )
+            for result in body_results:
+                if 'digest' in result:
+                    print(f"{result['url']} - {result['size']} 字节 - "
+                          f"sha256: {result['digest'][:16]}...")
+        
+        # 9. 响应缓存：第二轮直接命中缓存
+        await async_fetch_with_cache(
+            test_urls[-2:], ResponseCache(ttl=60), client=client
+        )
+        
+        # 10. 合并重复的在途请求（test_urls 中 delay/1 出现了两次）
+        await async_fetch_deduplicated(test_urls, client=client)
+        
+        # 11. 对冲请求：慢请求会触发备份请求
+        await async_fetch_hedged(test_urls, client=client)
+        
+        # 12. 按主机限速：httpbin.org 每秒最多 2 个请求
+        await async_fetch_rate_limited(test_urls, rate=2.0, burst=2, client=client)
+        
+        # 13. 同步、线程池与异步的对比
+        await compare_fetch_modes(test_urls[:4], concurrency=4)
+        
+        # 14. 紧凑结果记录：单调时钟计时 + 列式存储
+        await async_fetch_compact(test_urls, client=client)
+        
+        # 16. 流水线模式：有界队列 + 固定数量的工作协程，背压传递到 URL 来源
+        await async_fetch_pipeline(test_urls, workers=3, client=client)
+        
+        print(f"连接复用统计: {client.stats()}")
+        print()
     
-    # 6. 带重试的异步请求
-    retry_results = await async_fetch_with_retry(test_urls[:3], max_retries=2)
+    # 15. 分阶段计时：区分连接池排队、DNS、建连、服务器处理和传输
+    await async_fetch_with_phase_timing(test_urls)
     
     print("=== 性能对比总结 ===")
     print("同步请求: 按顺序执行，总时间 = 所有请求时间之和")
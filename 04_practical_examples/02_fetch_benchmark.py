@@ -0,0 +1,354 @@
+"""
+04_practical_examples/02_fetch_benchmark.py
+
+本地测试服务器与请求性能基准
+
+01_async_web_requests.py 的 main() 直接请求 httpbin.org，
+结果受网络波动影响，也无法离线复现。这个示例提供：
+1. 一个模拟 httpbin 的本地 aiohttp 服务器（/delay/N、/status/N、/bytes/N、/json，
+   以及返回 gzip 压缩 JSON 的 /gzip/N）
+2. 一个基准测试运行器：在相同的 N 和并发数下依次运行同步版本和各个异步版本，
+   以 JSON 输出吞吐量、p50/p95/p99 延迟和内存峰值
+
+用法：
+    python 04_practical_examples/02_fetch_benchmark.py --n 200 --concurrency 50
+"""
+
+import argparse
+import asyncio
+import contextlib
+import gzip
+import io
+import json
+import multiprocessing
+import os
+import time
+import tracemalloc
+
+from aiohttp import web
+
+from example_loader import load_sibling
+
+
+# 1. 模拟 httpbin 的本地测试服务器
+async def handle_delay(request):
+    """/delay/N：等待 N 秒（可以是小数）后返回"""
+    delay = float(request.match_info['seconds'])
+    await asyncio.sleep(delay)
+    return web.json_response({'delay': delay})
+
+
+async def handle_status(request):
+    """/status/N：返回指定状态码"""
+    return web.Response(status=int(request.match_info['code']))
+
+
+async def handle_bytes(request):
+    """/bytes/N：返回 N 个字节"""
+    return web.Response(body=os.urandom(int(request.match_info['count'])),
+                        content_type='application/octet-stream')
+
+
+JSON_BODY = {
+    'slideshow': {
+        'author': 'Yours Truly',
+        'date': 'date of publication',
+        'slides': [
+            {'title': 'Wake up to WonderWidgets!', 'type': 'all'},
+            {'items': ['Why <em>WonderWidgets</em> are great',
+                       'Who <em>buys</em> WonderWidgets'],
+             'title': 'Overview', 'type': 'all'},
+        ],
+        'title': 'Sample Slide Show',
+    }
+}
+
+
+async def handle_json(request):
+    """/json：返回与 httpbin 相同结构的 JSON"""
+    return web.json_response(JSON_BODY, headers={'ETag': '"sample-slide-show"'})
+
+
+async def handle_gzip(request):
+    """/gzip/N：返回 gzip 压缩的 JSON 文件（N 条记录，不设置 Content-Encoding，
+    客户端拿到的是压缩后的字节，相当于下载 .json.gz 文件）"""
+    count = int(request.match_info['count'])
+    records = [{'id': i, 'name': f'item-{i}', 'tags': ['a', 'b', 'c']}
+               for i in range(count)]
+    return web.Response(body=gzip.compress(json.dumps(records).encode()),
+                        content_type='application/gzip')
+
+
+def create_test_app():
+    """创建测试服务器应用"""
+    app = web.Application()
+    app.router.add_get('/delay/{seconds}', handle_delay)
+    app.router.add_get('/status/{code}', handle_status)
+    app.router.add_get('/bytes/{count}', handle_bytes)
+    app.router.add_get('/json', handle_json)
+    app.router.add_get('/gzip/{count}', handle_gzip)
+    return app
+
+
+async def start_test_server(host='127.0.0.1', port=0):
+    """在当前事件循环中启动测试服务器，返回 (runner, 基础 URL)
+
+    port=0 表示由系统分配空闲端口。
+    """
+    runner = web.AppRunner(create_test_app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f'http://{host}:{port}'
+
+
+def _serve_forever(conn, host, port):
+    """子进程入口：启动服务器并把基础 URL 发回父进程"""
+    async def serve():
+        runner, base_url = await start_test_server(host, port)
+        conn.send(base_url)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
+
+    asyncio.run(serve())
+
+
+@contextlib.contextmanager
+def test_server_process(host='127.0.0.1', port=0):
+    """在独立进程中运行测试服务器
+
+    同步版本会阻塞当前线程，而服务器的 CPU 和内存开销也不应计入客户端，
+    因此基准测试时把服务器放到单独的进程里。
+    """
+    parent_conn, child_conn = multiprocessing.Pipe()
+    process = multiprocessing.Process(
+        target=_serve_forever, args=(child_conn, host, port), daemon=True
+    )
+    process.start()
+    try:
+        yield parent_conn.recv()
+    finally:
+        process.terminate()
+        process.join()
+
+
+# 2. 基准测试
+def percentile(sorted_values, fraction):
+    """已排序列表的分位数（最近秩法）"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+def summarize(name, results, latencies, elapsed, peak_memory):
+    """把一次运行的结果整理成报告中的一项"""
+    latencies = sorted(latencies)
+    errors = sum(1 for result in results
+                 if 'error' in result or result.get('status', 200) >= 400)
+    return {
+        'variant': name,
+        'requests': len(results),
+        'errors': errors,
+        'elapsed_s': round(elapsed, 4),
+        'throughput_rps': round(len(results) / elapsed, 2) if elapsed else None,
+        'latency_ms': {
+            key: round(percentile(latencies, fraction) * 1000, 3)
+            if latencies else None
+            for key, fraction in (('p50', 0.50), ('p95', 0.95), ('p99', 0.99))
+        },
+        'peak_memory_kb': round(peak_memory / 1024, 1) if peak_memory else None,
+    }
+
+
+def result_latencies(results):
+    """每个请求的延迟：FetchResult 中从发出请求到读完响应体的单调时钟时间
+
+    所有版本都用 compact=True 运行，延迟的定义完全相同：
+    同步版本在 sync_fetch_url 内计时，异步版本在 async_fetch_url 内计时，
+    都包含等待连接池的时间和读取响应体的时间。
+    截止时间模式中未完成的请求等没有计时的结果不计入。
+    """
+    return [result.latency for result in results
+            if getattr(result, 'latency', None) is not None]
+
+
+def async_variants(fetch, concurrency):
+    """所有参与对比的异步版本：名称 -> 接收 (urls, client) 的协程函数
+
+    缓存、限速器等有状态的对象在每次运行时新建，各版本之间互不影响。
+    """
+    async def streaming(urls, client):
+        results = []
+        async for _, result in fetch.async_fetch_as_completed(
+                urls, max_in_flight=concurrency, client=client, compact=True):
+            results.append(result)
+        return results
+
+    async def pipeline(urls, client):
+        results = []
+
+        async def sink(index, result):
+            results.append(result)
+
+        await fetch.FetchPipeline(workers=concurrency, client=client,
+                                  compact=True).run(urls, sink)
+        return results
+
+    return {
+        'async_gather': lambda urls, client: fetch.async_fetch_multiple_urls(
+            urls, client=client, compact=True),
+        'async_progress': lambda urls, client: fetch.async_fetch_with_progress(
+            urls, client=client, compact=True),
+        'async_semaphore': lambda urls, client: fetch.async_fetch_with_semaphore(
+            urls, max_concurrent=concurrency, client=client, compact=True),
+        'async_adaptive': lambda urls, client: fetch.async_fetch_with_semaphore(
+            urls, client=client,
+            limiter=fetch.AdaptiveLimiter(max_limit=concurrency), compact=True),
+        'async_timeout': lambda urls, client: fetch.async_fetch_with_timeout(
+            urls, timeout=10, client=client, compact=True),
+        'async_deadline': lambda urls, client: fetch.async_fetch_with_timeout(
+            urls, timeout=10, deadline=60, client=client, compact=True),
+        'async_retry': lambda urls, client: fetch.async_fetch_with_retry(
+            urls, max_retries=2, client=client,
+            policy=fetch.RetryPolicy(max_retries=2, base_delay=0.01), compact=True),
+        'async_streaming': streaming,
+        'async_cache': lambda urls, client: fetch.async_fetch_multiple_urls(
+            urls, client=client, cache=fetch.ResponseCache(), compact=True),
+        'async_singleflight': lambda urls, client: fetch.async_fetch_multiple_urls(
+            urls, client=client, singleflight=fetch.SingleFlight(), compact=True),
+        'async_hedged': lambda urls, client: fetch.async_fetch_multiple_urls(
+            urls, client=client, hedging=fetch.HedgingPolicy(), compact=True),
+        # 限速设得足够高，测量的是限速器本身的开销，而不是限速的效果
+        'async_rate_limited': lambda urls, client: fetch.async_fetch_multiple_urls(
+            urls, client=client, compact=True,
+            rate_limiter=fetch.HostRateLimiter(rate=100000, burst=concurrency)),
+        'async_pipeline': pipeline,
+    }
+
+
+def run_measured(func, measure_memory):
+    """运行 func()，返回 (结果, 耗时, 内存峰值)；演示函数的打印输出被丢弃
+
+    tracemalloc 会明显降低吞吐量、拉高延迟，因此耗时和延迟来自不开启 tracemalloc 的一次运行；
+    measure_memory 为真时再单独运行一次，只用于统计内存峰值。
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        results = func()
+        elapsed = time.perf_counter() - start
+
+        peak = None
+        if measure_memory:
+            tracemalloc.start()
+            try:
+                func()
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+    return results, elapsed, peak
+
+
+def bench_sync(fetch, urls, measure_memory):
+    results, elapsed, peak = run_measured(
+        lambda: fetch.sync_fetch_multiple_urls(urls, compact=True), measure_memory
+    )
+    return summarize('sync', results, result_latencies(results), elapsed, peak)
+
+
+def bench_sync_threads(fetch, urls, concurrency, measure_memory):
+    results, elapsed, peak = run_measured(
+        lambda: fetch.sync_fetch_with_threads(urls, max_workers=concurrency,
+                                              compact=True),
+        measure_memory
+    )
+    return summarize('sync_threads', results, result_latencies(results), elapsed, peak)
+
+
+def bench_async(fetch, name, variant, urls, concurrency, measure_memory):
+    async def run():
+        async with fetch.FetchClient(limit=concurrency,
+                                     limit_per_host=concurrency) as client:
+            return await variant(urls, client)
+
+    results, elapsed, peak = run_measured(lambda: asyncio.run(run()), measure_memory)
+    return summarize(name, results, result_latencies(results), elapsed, peak)
+
+
+def run_benchmark(base_url, n=100, concurrency=20, paths=('/delay/0.05',),
+                  variants=None, include_sync=True, measure_memory=True):
+    """对 base_url 上的服务器运行基准测试，返回报告字典"""
+    fetch = load_sibling('01_async_web_requests.py', 'async_web_requests')
+    urls = [base_url + paths[i % len(paths)] for i in range(n)]
+    candidates = async_variants(fetch, concurrency)
+    if variants:
+        candidates = {name: candidates[name] for name in variants}
+
+    results = []
+    if include_sync:
+        results.append(bench_sync(fetch, urls, measure_memory))
+        results.append(bench_sync_threads(fetch, urls, concurrency, measure_memory))
+    for name, variant in candidates.items():
+        results.append(
+            bench_async(fetch, name, variant, urls, concurrency, measure_memory)
+        )
+
+    return {
+        'config': {
+            'n': n,
+            'concurrency': concurrency,
+            'paths': list(paths),
+            'measure_memory': measure_memory,
+        },
+        'results': results,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='同步/异步请求性能基准')
+    parser.add_argument('--n', type=int, default=100, help='请求总数')
+    parser.add_argument('--concurrency', type=int, default=20, help='最大并发数')
+    parser.add_argument('--paths', default='/delay/0.05,/bytes/1024,/json',
+                        help='逗号分隔的请求路径，按顺序循环使用')
+    parser.add_argument('--variants', default='',
+                        help='逗号分隔的异步版本名，默认全部')
+    parser.add_argument('--skip-sync', action='store_true',
+                        help='跳过同步版本（顺序和线程池）')
+    parser.add_argument('--no-memory', action='store_true',
+                        help='不统计内存峰值（每个版本可以少运行一次）')
+    parser.add_argument('--base-url', default='',
+                        help='使用已有的服务器，而不是启动本地测试服务器')
+    parser.add_argument('--output', default='', help='把 JSON 报告写入文件')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """主函数：启动本地测试服务器并输出 JSON 报告"""
+    args = parse_args(argv)
+    options = dict(
+        n=args.n,
+        concurrency=args.concurrency,
+        paths=[path for path in args.paths.split(',') if path],
+        variants=[name for name in args.variants.split(',') if name],
+        include_sync=not args.skip_sync,
+        measure_memory=not args.no_memory,
+    )
+
+    if args.base_url:
+        report = run_benchmark(args.base_url, **options)
+    else:
+        with test_server_process() as base_url:
+            report = run_benchmark(base_url, **options)
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+"""
+04_practical_examples/03_sharded_fetcher.py
+
+多进程分片请求
+
+一个事件循环只能用满一个 CPU 核心。当解析响应、统计结果等工作增加后，
+单进程的异步请求很快就会受限于 CPU。这个示例把 URL 流分给 N 个工作进程：
+
+- 每个工作进程有自己的事件循环和 FetchClient（连接池）
+- URL 按主机分片，同一主机的请求尽量落在同一个进程，便于复用连接
+- 工作进程按批次向主进程领取任务；自己的分片空了就从最长的分片"偷"一半，
+  慢分片的积压会被其他进程分担（work stealing）
+- 所有结果汇总回主进程，合并成一个按完成顺序产出的结果流
+
+用法：
+    python 04_practical_examples/03_sharded_fetcher.py --n 5000 --workers 4
+"""
+
+import argparse
+import asyncio
+import collections
+import multiprocessing
+import os
+import queue
+import time
+import zlib
+from urllib.parse import urlsplit
+
+from example_loader import load_sibling
+
+
+# 1. 工作进程：独立的事件循环 + 连接池
+async def _fetch_one(fetch, session, url, fetch_options):
+    """请求单个 URL；任何异常都变成错误结果，不让一个请求拖垮整个工作进程"""
+    try:
+        return await fetch.async_fetch_url(session, url, **fetch_options)
+    except Exception as e:
+        return {
+            'url': url,
+            'error': str(e) or type(e).__name__,
+            'time': time.time()
+        }
+
+
+async def _worker_loop(fetch, worker_id, task_queue, result_queue, concurrency,
+                       batch_size, fetch_options):
+    """领取任务批次、并发请求、把结果分批发回主进程"""
+    loop = asyncio.get_running_loop()
+    buffered = collections.deque()
+    pending = {}  # Task -> 原始索引
+    results = []
+    completed = 0
+    exhausted = False
+    get_batch = None
+    last_flush = time.monotonic()
+
+    def flush():
+        nonlocal results, last_flush
+        if results:
+            result_queue.put(('results', worker_id, results))
+            results = []
+        last_flush = time.monotonic()
+
+    async with fetch.FetchClient(limit=concurrency,
+                                 limit_per_host=concurrency) as client:
+        while True:
+            # 本地积压不足一批时提前领取下一批，让请求不断档
+            if get_batch is None and not exhausted and len(buffered) < batch_size:
+                result_queue.put(('need', worker_id))
+                # multiprocessing.Queue.get 会阻塞，放到线程池里等待
+                get_batch = loop.run_in_executor(None, task_queue.get)
+
+            while buffered and len(pending) < concurrency:
+                index, url = buffered.popleft()
+                task = asyncio.ensure_future(
+                    _fetch_one(fetch, client.session, url, fetch_options)
+                )
+                pending[task] = index
+
+            if not pending and get_batch is None:
+                break
+
+            waiting = set(pending)
+            if get_batch is not None:
+                waiting.add(get_batch)
+            done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+
+            if get_batch is not None and get_batch in done:
+                batch = get_batch.result()
+                get_batch = None
+                if batch is None:
+                    exhausted = True
+                else:
+                    buffered.extend(batch)
+
+            for task in done:
+                if task in pending:
+                    results.append((pending.pop(task), task.result()))
+                    completed += 1
+
+            # 手上没有请求时立即回传：主进程要等所有结果回来才会通知其他进程退出
+            if (len(results) >= batch_size or not pending
+                    or time.monotonic() - last_flush > 0.1):
+                flush()
+
+        flush()
+        result_queue.put(('done', worker_id, {
+            'completed': completed,
+            'connections': client.stats(),
+        }))
+
+
+def _worker_main(worker_id, task_queue, result_queue, concurrency, batch_size,
+                 fetch_options):
+    """工作进程入口"""
+    fetch = load_sibling('01_async_web_requests.py', 'async_web_requests')
+    asyncio.run(_worker_loop(fetch, worker_id, task_queue, result_queue,
+                             concurrency, batch_size, fetch_options))
+
+
+# 2. 主进程：分片、调度和结果合并
+class ShardedFetcher:
+    """把 URL 流分给多个工作进程并合并结果
+
+    workers: 工作进程数，默认等于 CPU 核心数
+    concurrency: 每个工作进程的最大并发请求数
+    batch_size: 每次派发/回传的条目数，越大进程间通信开销越小、负载越不均衡
+    max_buffered: 主进程最多预读的 URL 数，URL 来源可以是无限的生成器
+    fetch_options: 传给 async_fetch_url 的参数（需要能被 pickle，例如 stream=True）
+    poll_interval: 主进程等待结果时检查工作进程存活的间隔（秒）
+
+    工作进程意外退出（异常、被 OOM 杀掉、段错误）时，它已领取但未返回的任务
+    放回分片，由其他进程偷走完成；没有进程可以接手时抛出 RuntimeError。
+    """
+
+    def __init__(self, workers=None, concurrency=50, batch_size=100,
+                 max_buffered=10000, fetch_options=None, poll_interval=0.5):
+        self.workers = workers or os.cpu_count() or 1
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.max_buffered = max(max_buffered, batch_size * self.workers)
+        self.fetch_options = fetch_options or {}
+        self.poll_interval = poll_interval
+        self.stats = {}
+
+    def shard_for(self, url):
+        """按主机分片，同一主机的请求尽量由同一个进程处理"""
+        host = urlsplit(url).netloc.encode()
+        return zlib.crc32(host) % self.workers
+
+    def iter_results(self, urls):
+        """按完成顺序产出 (原始索引, 结果)"""
+        ctx = multiprocessing.get_context()
+        result_queue = ctx.Queue()
+        task_queues = [ctx.Queue() for _ in range(self.workers)]
+        processes = [
+            ctx.Process(
+                target=_worker_main,
+                args=(worker_id, task_queues[worker_id], result_queue,
+                      self.concurrency, self.batch_size, self.fetch_options),
+                daemon=True,
+            )
+            for worker_id in range(self.workers)
+        ]
+        for process in processes:
+            process.start()
+
+        shards = [collections.deque() for _ in range(self.workers)]
+        url_iter = enumerate(urls)
+        buffered = 0
+        exhausted = False
+        # 每个工作进程已领取、尚未返回结果的任务：原始索引 -> URL
+        in_flight = [{} for _ in range(self.workers)]
+        self.stats = {
+            worker_id: {'assigned': 0, 'stolen': 0}
+            for worker_id in range(self.workers)
+        }
+
+        def refill():
+            """从 URL 来源预读，直到达到 max_buffered"""
+            nonlocal buffered, exhausted
+            while not exhausted and buffered < self.max_buffered:
+                try:
+                    index, url = next(url_iter)
+                except StopIteration:
+                    exhausted = True
+                    return
+                shards[self.shard_for(url)].append((index, url))
+                buffered += 1
+
+        def take_batch(worker_id):
+            """优先取自己的分片；为空时从最长的分片尾部偷一半"""
+            nonlocal buffered
+            own = shards[worker_id]
+            if own:
+                count = min(self.batch_size, len(own))
+                batch = [own.popleft() for _ in range(count)]
+            else:
+                victim = max(shards, key=len)
+                if not victim:
+                    return None
+                count = min(self.batch_size, (len(victim) + 1) // 2)
+                batch = [victim.pop() for _ in range(count)]
+                self.stats[worker_id]['stolen'] += count
+            self.stats[worker_id]['assigned'] += count
+            buffered -= count
+            in_flight[worker_id].update(batch)
+            return batch
+
+        def requeue(worker_id):
+            """把退出的工作进程手上的任务放回分片，由其他进程偷走"""
+            nonlocal buffered
+            lost = in_flight[worker_id]
+            in_flight[worker_id] = {}
+            for index, url in lost.items():
+                shards[worker_id].append((index, url))
+            buffered += len(lost)
+
+        def dispatch():
+            """给等待任务的工作进程派发批次
+
+            分片都空了但还有进程在处理任务时，先不回复 None：
+            那个进程意外退出时，它的任务会放回分片，需要有进程接手。
+            """
+            for worker_id in list(idle):
+                refill()
+                batch = take_batch(worker_id)
+                if batch is not None:
+                    task_queues[worker_id].put(batch)
+                    idle.discard(worker_id)
+            if idle and not any(in_flight[worker_id] for worker_id in running):
+                # None 表示没有更多任务，工作进程处理完手上的请求后退出
+                for worker_id in idle:
+                    task_queues[worker_id].put(None)
+                idle.clear()
+
+        running = set(range(self.workers))
+        idle = set()  # 发出了 'need'、还没有收到回复的工作进程
+        next_check = time.monotonic() + self.poll_interval
+        try:
+            while running:
+                try:
+                    messages = [result_queue.get(timeout=self.poll_interval)]
+                except queue.Empty:
+                    messages = []
+
+                # 定期检查进程是否存活；结果源源不断时也要检查
+                dead = []
+                if not messages or time.monotonic() >= next_check:
+                    next_check = time.monotonic() + self.poll_interval
+                    dead = [worker_id for worker_id in running
+                            if not processes[worker_id].is_alive()]
+                    # 先处理队列中剩下的消息（包括正常退出前发出的 'done'），
+                    # 再判断哪些进程是意外退出的
+                    while dead:
+                        try:
+                            messages.append(result_queue.get_nowait())
+                        except queue.Empty:
+                            break
+
+                for message in messages:
+                    kind, worker_id = message[0], message[1]
+                    if kind == 'results':
+                        for index, result in message[2]:
+                            in_flight[worker_id].pop(index, None)
+                            yield index, result
+                    elif kind == 'need' and worker_id in running:
+                        idle.add(worker_id)
+                    elif kind == 'done':
+                        self.stats[worker_id].update(message[2])
+                        running.discard(worker_id)
+
+                for worker_id in dead:
+                    if worker_id not in running:
+                        continue
+                    running.discard(worker_id)
+                    idle.discard(worker_id)
+                    self.stats[worker_id]['exitcode'] = processes[worker_id].exitcode
+                    requeue(worker_id)
+
+                dispatch()
+
+            if buffered or not exhausted:
+                # 所有工作进程都意外退出了，剩下的任务没有进程可以接手
+                exitcodes = {worker_id: stats['exitcode']
+                             for worker_id, stats in self.stats.items()
+                             if 'exitcode' in stats}
+                raise RuntimeError(f"工作进程意外退出，仍有任务未完成（退出码 {exitcodes}）")
+        finally:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+                process.join()
+
+
+# 3. 演示：单进程与多进程对比
+async def _single_process(fetch, urls, concurrency):
+    count = 0
+    async with fetch.FetchClient(limit=concurrency,
+                                 limit_per_host=concurrency) as client:
+        async for _ in fetch.async_fetch_as_completed(
+                urls, max_in_flight=concurrency, client=client):
+            count += 1
+    return count
+
+
+def main(argv=None):
+    """主函数：在本地测试服务器上对比单进程和多进程的吞吐量"""
+    parser = argparse.ArgumentParser(description='多进程分片请求演示')
+    parser.add_argument('--n', type=int, default=2000, help='请求总数')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='工作进程数')
+    parser.add_argument('--concurrency', type=int, default=50,
+                        help='每个进程的最大并发数')
+    parser.add_argument('--path', default='/bytes/1024', help='请求路径')
+    args = parser.parse_args(argv)
+
+    print("=== 多进程分片请求演示 ===\n")
+    fetch = load_sibling('01_async_web_requests.py', 'async_web_requests')
+    benchmark = load_sibling('02_fetch_benchmark.py', 'fetch_benchmark')
+
+    with benchmark.test_server_process() as base_url:
+        # 用生成器提供 URL，主进程按需预读
+        def url_source():
+            for _ in range(args.n):
+                yield base_url + args.path
+
+        start_time = time.perf_counter()
+        count = asyncio.run(_single_process(fetch, url_source(), args.concurrency))
+        elapsed = time.perf_counter() - start_time
+        print(f"单进程: {count} 个请求, 耗时 {elapsed:.2f} 秒, "
+              f"吞吐量 {count / elapsed:.0f} 请求/秒")
+
+        fetcher = ShardedFetcher(workers=args.workers, concurrency=args.concurrency)
+        start_time = time.perf_counter()
+        count = sum(1 for _ in fetcher.iter_results(url_source()))
+        elapsed = time.perf_counter() - start_time
+        print(f"{fetcher.workers} 个进程: {count} 个请求, 耗时 {elapsed:.2f} 秒, "
+              f"吞吐量 {count / elapsed:.0f} 请求/秒")
+
+    print("\n各进程统计:")
+    for worker_id, stats in fetcher.stats.items():
+        print(f"  进程 {worker_id}: 分配 {stats['assigned']}, "
+              f"偷取 {stats['stolen']}, 完成 {stats.get('completed')}")
+
+
+if __name__ == "__main__":
+    main()
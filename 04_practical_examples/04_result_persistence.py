@@ -0,0 +1,275 @@
+"""
+04_practical_examples/04_result_persistence.py
+
+把请求结果批量写入 SQLite
+
+01_async_web_requests.py 中的结果只是打印出来或作为列表返回，
+大规模抓取时需要把结果持久化。逐行 INSERT + COMMIT 的写法每条结果都要
+等一次磁盘同步，写入速度很快就会拖慢请求。这个示例用 aiosqlite 实现：
+
+- 单个写入协程：所有结果通过一个有界队列交给它，只有它访问数据库连接
+- 批量写入：一批结果用一次 executemany 在同一个事务中写入
+- 按数量或时间刷新：攒够 batch_size 条，或距离本批第一条超过 flush_interval 秒
+- WAL 模式：写入时不阻塞读取，提交只需追加日志
+
+用法：
+    python 04_practical_examples/04_result_persistence.py --n 2000
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import aiosqlite
+
+from example_loader import load_sibling
+
+
+# 1. 表结构
+CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS fetch_results (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL,
+    status INTEGER,
+    size INTEGER,
+    latency REAL,
+    digest TEXT,
+    error TEXT,
+    fetched_at REAL NOT NULL
+)
+"""
+
+INSERT_ROW = """
+INSERT INTO fetch_results (url, status, size, latency, digest, error, fetched_at)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def result_to_row(result):
+    """把 async_fetch_url 的结果（字典或 FetchResult）转换成一行"""
+    return (
+        result['url'],
+        result.get('status'),
+        result.get('size'),
+        result.get('latency'),
+        result.get('digest'),
+        result.get('error'),
+        result.get('time', time.time()),
+    )
+
+
+async def open_database(path):
+    """打开数据库：WAL 模式 + 建表"""
+    db = await aiosqlite.connect(path)
+    await db.execute('PRAGMA journal_mode=WAL')
+    # WAL 模式下 NORMAL 只在检查点时同步磁盘，断电最多丢失最近几个事务
+    await db.execute('PRAGMA synchronous=NORMAL')
+    await db.execute(CREATE_TABLE)
+    await db.commit()
+    return db
+
+
+# 2. 批量写入器
+class ResultWriter:
+    """单写入协程 + 批量事务的结果写入器
+
+    batch_size: 每个事务最多写入的行数
+    flush_interval: 本批第一条结果等待的最长时间（秒），结果稀疏时也能及时落盘
+    queue_size: 等待写入的结果上限；写入跟不上时 write() 会等待，
+        把背压传递给请求端，而不是在内存中无限堆积
+
+    write(index, result) 的签名与 FetchPipeline 的 sink 相同，可以直接作为 sink：
+
+        async with ResultWriter('results.db') as writer:
+            await FetchPipeline(workers=50).run(urls, writer.write)
+    """
+
+    def __init__(self, path, batch_size=500, flush_interval=1.0, queue_size=None):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue_size = queue_size or batch_size * 4
+        self.stats = {'rows': 0, 'batches': 0, 'size_flushes': 0, 'time_flushes': 0}
+        self._db = None
+        self._queue = None
+        self._writer_task = None
+
+    async def start(self):
+        self._db = await open_database(self.path)
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._writer_task = asyncio.ensure_future(self._writer_loop())
+        return self
+
+    async def write(self, index, result):
+        """提交一条结果；队列已满时等待写入协程跟上"""
+        if self._writer_task.done():
+            # 写入协程已经出错退出，把异常抛给调用方而不是一直等待
+            self._writer_task.result()
+        await self._put(result_to_row(result))
+
+    async def close(self):
+        """写完队列中剩余的结果并关闭数据库"""
+        if self._writer_task is None:
+            return
+        try:
+            if not self._writer_task.done():
+                await self._put(None)  # 结束标记
+            await self._writer_task
+        finally:
+            self._writer_task = None
+            await self._db.close()
+
+    async def _put(self, item):
+        """入队；队列已满时同时等待入队和写入协程
+
+        写入协程在等待期间出错退出时队列不会再被取走，
+        不能一直等在 put() 上，直接抛出写入协程的异常
+        """
+        if not self._queue.full():
+            self._queue.put_nowait(item)
+            return
+        put = asyncio.ensure_future(self._queue.put(item))
+        try:
+            done, _ = await asyncio.wait({put, self._writer_task},
+                                         return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            if not put.done():
+                put.cancel()
+        if put not in done:
+            self._writer_task.result()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def _flush(self, rows):
+        await self._db.executemany(INSERT_ROW, rows)
+        await self._db.commit()
+        self.stats['rows'] += len(rows)
+        self.stats['batches'] += 1
+
+    async def _writer_loop(self):
+        loop = asyncio.get_running_loop()
+        rows = []
+        flush_at = None
+        while True:
+            try:
+                if rows:
+                    row = await asyncio.wait_for(
+                        self._queue.get(), max(0.0, flush_at - loop.time())
+                    )
+                else:
+                    row = await self._queue.get()
+            except asyncio.TimeoutError:
+                self.stats['time_flushes'] += 1
+                await self._flush(rows)
+                rows = []
+                continue
+
+            if row is None:
+                break
+            if not rows:
+                flush_at = loop.time() + self.flush_interval
+            rows.append(row)
+            if len(rows) >= self.batch_size:
+                self.stats['size_flushes'] += 1
+                await self._flush(rows)
+                rows = []
+
+        if rows:
+            await self._flush(rows)
+
+
+# 3. 对比：逐行写入
+class RowByRowWriter:
+    """每条结果单独 INSERT + COMMIT，使用 SQLite 默认的日志模式，仅用于对比"""
+
+    def __init__(self, path):
+        self.path = path
+        self.stats = {'rows': 0}
+        self._db = None
+
+    async def __aenter__(self):
+        self._db = await aiosqlite.connect(self.path)
+        await self._db.execute(CREATE_TABLE)
+        await self._db.commit()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self._db.close()
+
+    async def write(self, index, result):
+        await self._db.execute(INSERT_ROW, result_to_row(result))
+        await self._db.commit()
+        self.stats['rows'] += 1
+
+
+async def summarize_database(path):
+    """按状态码统计已写入的结果"""
+    async with aiosqlite.connect(path) as db:
+        async with db.execute(
+                'SELECT COALESCE(status, -1), COUNT(*) FROM fetch_results '
+                'GROUP BY status ORDER BY status') as cursor:
+            return {status: count async for status, count in cursor}
+
+
+# 4. 演示
+async def run_demo(fetch, base_url, n, workers, batch_size):
+    urls = [base_url + path for path in ('/json', '/bytes/1024', '/status/404')]
+
+    def url_source():
+        for i in range(n):
+            yield urls[i % len(urls)]
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for name, make_writer in (
+                ('逐行写入', lambda path: RowByRowWriter(path)),
+                ('批量写入', lambda path: ResultWriter(path, batch_size=batch_size))):
+            path = os.path.join(temp_dir, f'{name}.db')
+            async with fetch.FetchClient(limit=workers,
+                                         limit_per_host=workers) as client:
+                pipeline = fetch.FetchPipeline(workers=workers, client=client,
+                                               compact=True)
+                start_time = time.perf_counter()
+                async with make_writer(path) as writer:
+                    sink_time = 0.0
+
+                    async def timed_sink(index, result):
+                        # 工作协程阻塞在写入上的时间，也就是持久化拖慢请求的时间
+                        nonlocal sink_time
+                        started = time.perf_counter()
+                        await writer.write(index, result)
+                        sink_time += time.perf_counter() - started
+
+                    await pipeline.run(url_source(), timed_sink)
+                elapsed = time.perf_counter() - start_time
+
+            print(f"{name}: {writer.stats['rows']} 行, 耗时 {elapsed:.2f} 秒, "
+                  f"吞吐量 {n / elapsed:.0f} 请求/秒, "
+                  f"工作协程等待写入累计 {sink_time:.2f} 秒")
+            print(f"  写入统计: {writer.stats}")
+            print(f"  按状态码: {await summarize_database(path)}")
+
+
+def main(argv=None):
+    """主函数：在本地测试服务器上对比逐行写入和批量写入"""
+    parser = argparse.ArgumentParser(description='请求结果批量写入 SQLite 演示')
+    parser.add_argument('--n', type=int, default=2000, help='请求总数')
+    parser.add_argument('--workers', type=int, default=50, help='工作协程数')
+    parser.add_argument('--batch-size', type=int, default=500, help='每个事务的行数')
+    args = parser.parse_args(argv)
+
+    print("=== 请求结果批量写入 SQLite 演示 ===\n")
+    fetch = load_sibling('01_async_web_requests.py', 'async_web_requests')
+    benchmark = load_sibling('02_fetch_benchmark.py', 'fetch_benchmark')
+
+    with benchmark.test_server_process() as base_url:
+        asyncio.run(run_demo(fetch, base_url, args.n, args.workers, args.batch_size))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+04_practical_examples/05_event_loop_runner.py
+
+可切换事件循环实现的运行器
+
+每个示例都以 asyncio.run(main()) 结尾，只能使用默认的事件循环。
+生产环境中常用 uvloop（基于 libuv）替换默认实现，这个示例提供：
+1. run(main, loop='uvloop')：在指定的事件循环实现上运行协程，
+   也可以从命令行运行任意示例文件的 main()
+2. 一组基准测试，在每种事件循环上分别测量：
+   - Task 吞吐量：concurrent_tasks_demo 中 create_task + gather 的写法
+   - 调度延迟：大量就绪任务排队时，定时回调比预定时间晚多久
+   - 请求吞吐量：用 01_async_web_requests.py 的 FetchPipeline 请求本地测试服务器
+
+uvloop 是可选依赖（不支持 Windows），未安装时只运行 asyncio。
+
+用法：
+    python 04_practical_examples/05_event_loop_runner.py run 02_core_components/01_tasks.py --loop uvloop
+    python 04_practical_examples/05_event_loop_runner.py bench --n 20000
+"""
+
+import argparse
+import asyncio
+import time
+
+from example_loader import load_path, load_sibling
+
+
+# 1. 事件循环实现
+def available_loops():
+    """可用的事件循环实现：名称 -> 创建事件循环的函数"""
+    loops = {'asyncio': asyncio.new_event_loop}
+    try:
+        import uvloop
+    except ImportError:
+        pass
+    else:
+        loops['uvloop'] = uvloop.new_event_loop
+    return loops
+
+
+def _cancel_all_tasks(loop):
+    """与 asyncio.run 相同：取消剩余的任务并等待它们结束"""
+    tasks = [task for task in asyncio.all_tasks(loop) if not task.done()]
+    for task in tasks:
+        task.cancel()
+    if tasks:
+        loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+
+
+def run(main, loop='asyncio', debug=False):
+    """在指定的事件循环实现上运行协程 main，用法与 asyncio.run 相同
+
+    不修改全局的事件循环策略，因此同一个进程里可以依次使用不同的实现。
+    """
+    loops = available_loops()
+    if loop not in loops:
+        raise ValueError(f"事件循环 {loop!r} 不可用，可选: {', '.join(loops)}")
+
+    event_loop = loops[loop]()
+    try:
+        asyncio.set_event_loop(event_loop)
+        event_loop.set_debug(debug)
+        return event_loop.run_until_complete(main)
+    finally:
+        try:
+            _cancel_all_tasks(event_loop)
+            event_loop.run_until_complete(event_loop.shutdown_asyncgens())
+        finally:
+            asyncio.set_event_loop(None)
+            event_loop.close()
+
+
+def run_module(path, loop='asyncio'):
+    """在指定的事件循环上运行示例文件中的 main()"""
+    module = load_path(path, '__example__')
+    return run(module.main(), loop)
+
+
+# 2. 基准测试
+async def bench_tasks(n):
+    """Task 吞吐量：创建 n 个 Task 并用 gather 等待，返回每秒完成的 Task 数"""
+    async def short_task(i):
+        await asyncio.sleep(0)
+        return i
+
+    start = time.perf_counter()
+    await asyncio.gather(*[asyncio.create_task(short_task(i)) for i in range(n)])
+    return n / (time.perf_counter() - start)
+
+
+async def bench_scheduling_latency(background, samples=200, interval=0.001):
+    """调度延迟：background 个任务不断让出控制权时，
+    每次 sleep(interval) 实际比预定时间晚多少秒，返回已排序的延迟列表"""
+    stop = False
+
+    async def busy():
+        while not stop:
+            await asyncio.sleep(0)
+
+    workers = [asyncio.create_task(busy()) for _ in range(background)]
+    await asyncio.sleep(0)
+
+    lateness = []
+    try:
+        for _ in range(samples):
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            lateness.append(max(0.0, time.perf_counter() - start - interval))
+    finally:
+        stop = True
+        await asyncio.gather(*workers)
+    return sorted(lateness)
+
+
+async def bench_requests(fetch, base_url, n, concurrency):
+    """请求吞吐量：FetchPipeline 请求本地测试服务器，返回每秒完成的请求数"""
+    urls = (base_url + '/bytes/1024' for _ in range(n))
+    async with fetch.FetchClient(limit=concurrency,
+                                 limit_per_host=concurrency) as client:
+        pipeline = fetch.FetchPipeline(workers=concurrency, client=client)
+        start = time.perf_counter()
+        stats = await pipeline.run(urls)
+        elapsed = time.perf_counter() - start
+    if stats['errors']:
+        print(f"  警告: {stats['errors']} 个请求失败")
+    return stats['completed'] / elapsed
+
+
+def run_benchmarks(loop_names, n, background, requests_n, concurrency):
+    """在每种事件循环上运行全部基准测试，返回 {名称: 结果}"""
+    fetch = load_sibling('01_async_web_requests.py', 'async_web_requests')
+    benchmark = load_sibling('02_fetch_benchmark.py', 'fetch_benchmark')
+
+    report = {}
+    # 测试服务器运行在独立进程中，始终使用默认事件循环，不影响对比
+    with benchmark.test_server_process() as base_url:
+        for name in loop_names:
+            lateness = run(bench_scheduling_latency(background), name)
+            report[name] = {
+                'tasks_per_s': run(bench_tasks(n), name),
+                'latency_p50_ms': benchmark.percentile(lateness, 0.50) * 1000,
+                'latency_p99_ms': benchmark.percentile(lateness, 0.99) * 1000,
+                'requests_per_s': run(
+                    bench_requests(fetch, base_url, requests_n, concurrency), name
+                ),
+            }
+    return report
+
+
+def print_report(report):
+    for name, result in report.items():
+        print(f"{name}: Task {result['tasks_per_s']:.0f} 个/秒, "
+              f"调度延迟 p50 {result['latency_p50_ms']:.3f} ms / "
+              f"p99 {result['latency_p99_ms']:.3f} ms, "
+              f"请求 {result['requests_per_s']:.0f} 个/秒")
+
+
+def main(argv=None):
+    """主函数：运行示例或对比各事件循环实现"""
+    loops = list(available_loops())
+    parser = argparse.ArgumentParser(description='可切换事件循环实现的运行器')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='在指定的事件循环上运行示例的 main()')
+    run_parser.add_argument('path', help='示例文件路径')
+    run_parser.add_argument('--loop', default='asyncio', choices=loops)
+
+    bench_parser = commands.add_parser('bench', help='对比各事件循环实现')
+    bench_parser.add_argument('--n', type=int, default=20000, help='Task 数')
+    bench_parser.add_argument('--background', type=int, default=1000,
+                              help='测量调度延迟时的后台任务数')
+    bench_parser.add_argument('--requests', type=int, default=2000, help='请求总数')
+    bench_parser.add_argument('--concurrency', type=int, default=50, help='并发请求数')
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        print(f"=== 使用 {args.loop} 事件循环运行 {args.path} ===\n")
+        run_module(args.path, args.loop)
+        return
+
+    print(f"=== 事件循环实现对比（可用: {', '.join(loops)}）===\n")
+    if 'uvloop' not in loops:
+        print("未安装 uvloop（pip install uvloop），只测量 asyncio\n")
+    report = run_benchmarks(loops, args.n, args.background, args.requests,
+                            args.concurrency)
+    print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+"""
+04_practical_examples/06_response_postprocessing.py
+
+把 CPU 密集的响应处理放到进程池
+
+01_async_web_requests.py 只统计响应体的长度。实际抓取中还要解压、解析 JSON、
+计算摘要，这些都是 CPU 密集的工作：在事件循环里直接做，处理期间所有网络 I/O
+都会停下来。这个示例把响应体交给 ProcessPoolExecutor：
+
+- 批量提交：攒够 batch_size 个响应体（或等待 flush_interval 秒）才提交一次，
+  进程间通信和 pickle 的固定开销由整批分摊
+- 大响应体走共享内存：超过 shm_threshold 的响应体复制到 SharedMemory，
+  只把名字和长度传给工作进程，避免 pickle 大块字节
+- 有界提交：在途的响应体数量有上限，处理跟不上时 submit() 会等待
+
+用法：
+    python 04_practical_examples/06_response_postprocessing.py --n 400
+"""
+
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Python 3.7 没有共享内存模块，所有响应体都走 pickle
+    shared_memory = None
+
+from example_loader import load_sibling
+
+
+# 1. 在工作进程中执行的处理函数（必须定义在模块顶层才能被 pickle）
+def process_body(body):
+    """解压、解析 JSON 并计算 sha256，body 可以是 bytes 或 memoryview"""
+    result = {'size': len(body), 'sha256': hashlib.sha256(body).hexdigest()}
+    data = body
+    if body[:2] == b'\x1f\x8b':  # gzip 文件头
+        data = gzip.decompress(body)
+        result['decompressed_size'] = len(data)
+    try:
+        parsed = json.loads(bytes(data))
+    except ValueError:
+        return result
+    result['json_type'] = type(parsed).__name__
+    if isinstance(parsed, (list, dict)):
+        result['json_items'] = len(parsed)
+    return result
+
+
+def _attach_shared_memory(name):
+    """在工作进程中打开父进程创建的共享内存
+
+    进程池的工作进程与父进程共用同一个 resource_tracker，登记是幂等的；
+    共享内存的生命周期由父进程管理（处理完后 unlink）。
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+def _process_payload(payload):
+    kind, value = payload
+    if kind == 'bytes':
+        return process_body(value)
+    name, size = value
+    shm = _attach_shared_memory(name)
+    buffer = shm.buf[:size]
+    try:
+        return process_body(buffer)
+    finally:
+        # 关闭共享内存前必须先释放所有指向它的 memoryview
+        buffer.release()
+        shm.close()
+
+
+def _process_batch(payloads):
+    """工作进程入口：处理一批响应体，单个失败不影响同批其他条目"""
+    results = []
+    for payload in payloads:
+        try:
+            results.append(_process_payload(payload))
+        except Exception as e:
+            results.append({'error': str(e) or type(e).__name__})
+    return results
+
+
+# 2. 事件循环一侧：批量提交到进程池
+def _pool_context():
+    """进程池使用的启动方式
+
+    进程池在事件循环运行中创建，此时已经有 aiohttp 的 DNS 解析线程、aiofiles 的
+    线程池等线程在运行；Linux 默认的 fork 只复制当前线程，可能复制到其他线程
+    持有的锁，导致工作进程死锁。因此优先使用 forkserver，不支持时使用 spawn。
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context(
+        'forkserver' if 'forkserver' in methods else 'spawn'
+    )
+
+
+class PostProcessor:
+    """把响应体批量交给进程池处理
+
+    max_workers: 工作进程数，默认等于 CPU 核心数
+    batch_size: 每次提交给进程池的响应体数
+    flush_interval: 不满一批时最多等待的时间（秒）
+    shm_threshold: 超过这个字节数的响应体通过共享内存传递，None 表示不使用
+    max_pending: 已提交但尚未处理完的响应体上限，默认 batch_size * 4
+
+        async with PostProcessor() as processor:
+            future = await processor.submit(result['body'])
+            ...
+            info = await future
+    """
+
+    def __init__(self, max_workers=None, batch_size=32, flush_interval=0.05,
+                 shm_threshold=256 * 1024, max_pending=None):
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.shm_threshold = shm_threshold if shared_memory is not None else None
+        self.max_pending = max_pending or batch_size * 4
+        self.stats = {'items': 0, 'batches': 0, 'shared_memory': 0, 'errors': 0}
+        self._pool = None
+        self._slots = None
+        self._batch = []
+        self._timer = None
+        self._running = set()
+
+    async def start(self):
+        self._pool = ProcessPoolExecutor(max_workers=self.max_workers,
+                                         mp_context=_pool_context())
+        self._slots = asyncio.Semaphore(self.max_pending)
+        return self
+
+    async def submit(self, body):
+        """提交一个响应体，返回处理结果的 Future
+
+        只在在途数量达到 max_pending 时等待，不等待处理完成。
+        """
+        await self._slots.acquire()
+        loop = asyncio.get_running_loop()
+        block = None
+        try:
+            if self.shm_threshold is not None and len(body) >= self.shm_threshold:
+                block = shared_memory.SharedMemory(create=True, size=len(body))
+                block.buf[:len(body)] = body
+                payload = ('shm', (block.name, len(body)))
+                self.stats['shared_memory'] += 1
+            else:
+                payload = ('bytes', body)
+        except BaseException:
+            # 创建或写入共享内存失败（例如 /dev/shm 已满）时归还名额
+            if block is not None:
+                block.close()
+                block.unlink()
+            self._slots.release()
+            raise
+
+        future = loop.create_future()
+        self._batch.append((payload, block, future))
+        if len(self._batch) >= self.batch_size:
+            self._dispatch()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.flush_interval, self._dispatch)
+        return future
+
+    def _dispatch(self):
+        """把当前批次交给进程池"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._batch:
+            return
+        batch, self._batch = self._batch, []
+        loop = asyncio.get_running_loop()
+        running = loop.run_in_executor(
+            self._pool, _process_batch, [payload for payload, _, _ in batch]
+        )
+        self._running.add(running)
+        running.add_done_callback(lambda done: self._on_batch_done(done, batch))
+        self.stats['batches'] += 1
+
+    def _on_batch_done(self, done, batch):
+        self._running.discard(done)
+        if done.cancelled():
+            results = [{'error': 'Cancelled'}] * len(batch)
+        elif done.exception() is not None:
+            # 整批失败（例如工作进程崩溃）
+            error = str(done.exception()) or type(done.exception()).__name__
+            results = [{'error': error}] * len(batch)
+        else:
+            results = done.result()
+
+        for (_, block, future), result in zip(batch, results):
+            if block is not None:
+                block.close()
+                block.unlink()
+            if 'error' in result:
+                self.stats['errors'] += 1
+            self.stats['items'] += 1
+            if not future.done():
+                future.set_result(result)
+            self._slots.release()
+
+    async def close(self):
+        """处理完剩余的响应体并关闭进程池"""
+        if self._pool is None:
+            return
+        self._dispatch()
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+        self._pool.shutdown()
+        self._pool = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+
+# 3. 演示：在事件循环中直接处理 vs 交给进程池
+async def monitor_loop_lag(stop, interval=0.01):
+    """定时 sleep(interval)，返回事件循环最大的响应延迟（秒）"""
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - start - interval)
+    return worst
+
+
+async def run_mode(fetch, urls, mode, workers, batch_size):
+    """用 FetchPipeline 抓取 urls，并按 mode 处理响应体"""
+    stop = asyncio.Event()
+    monitor = asyncio.ensure_future(monitor_loop_lag(stop))
+    processed = []
+    start_time = time.perf_counter()
+
+    async with fetch.FetchClient(limit=workers, limit_per_host=workers) as client:
+        pipeline = fetch.FetchPipeline(workers=workers, client=client,
+                                       keep_body=True)
+        if mode == 'inline':
+            async def sink(index, result):
+                if 'body' in result:
+                    processed.append(process_body(result.pop('body')))
+
+            await pipeline.run(urls, sink)
+        else:
+            async with PostProcessor(batch_size=batch_size) as processor:
+                async def sink(index, result):
+                    if 'body' in result:
+                        processed.append(await processor.submit(result.pop('body')))
+
+                await pipeline.run(urls, sink)
+            processed = [future.result() for future in processed]
+            print(f"  进程池统计: {processor.stats}")
+
+    elapsed = time.perf_counter() - start_time
+    stop.set()
+    worst_lag = await monitor
+    items = sum(result.get('json_items', 0) for result in processed)
+    print(f"{mode}: {len(processed)} 个响应, 解析出 {items} 条 JSON 记录, "
+          f"耗时 {elapsed:.2f} 秒, 事件循环最大延迟 {worst_lag * 1000:.1f} ms")
+
+
+def main(argv=None):
+    """主函数：在本地测试服务器上对比两种处理方式"""
+    parser = argparse.ArgumentParser(description='进程池处理响应体演示')
+    parser.add_argument('--n', type=int, default=400, help='请求总数')
+    parser.add_argument('--workers', type=int, default=20, help='工作协程数')
+    parser.add_argument('--batch-size', type=int, default=16, help='每批响应体数')
+    args = parser.parse_args(argv)
+
+    print("=== 进程池处理响应体演示 ===\n")
+    fetch = load_sibling('01_async_web_requests.py', 'async_web_requests')
+    benchmark = load_sibling('02_fetch_benchmark.py', 'fetch_benchmark')
+
+    with benchmark.test_server_process() as base_url:
+        # 压缩的 JSON 需要解压和解析，1 MB 的随机字节会走共享内存
+        paths = ['/gzip/5000', '/json', '/bytes/1048576']
+        urls = [base_url + paths[i % len(paths)] for i in range(args.n)]
+        for mode in ('inline', 'process_pool'):
+            asyncio.run(run_mode(fetch, urls, mode, args.workers, args.batch_size))
+
+
+if __name__ == "__main__":
+    main()
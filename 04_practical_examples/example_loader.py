@@ -0,0 +1,31 @@
+"""
+04_practical_examples/example_loader.py
+
+按路径加载示例文件
+
+示例文件名以数字开头（如 01_async_web_requests.py），无法直接 import。
+本目录下的示例通过这里的函数互相加载，例如基准测试加载请求函数：
+
+    from example_loader import load_sibling
+
+    fetch = load_sibling('01_async_web_requests.py', 'async_web_requests')
+"""
+
+import importlib.util
+import os
+
+
+def load_path(path, module_name):
+    """按路径加载示例文件"""
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_sibling(filename, module_name):
+    """加载本目录下的示例文件"""
+    return load_path(
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), filename),
+        module_name
+    )